@@ -0,0 +1,246 @@
+"""
+Headless benchmarks of `Simulation.next_step` over parameter sweeps.
+
+    python -m benchmarks.run --sweep bots --sweep map --output results.json
+
+Every case reports ticks per second, the time spent in each phase of a
+tick, peak memory and allocations per tick. The sense sweep instead times
+`Simulation.sense` and checks it fits in one frame. Results are printed as
+a table and optionally written as JSON, so runs can be compared against
+each other.
+"""
+import argparse
+import functools
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.scenarios import build_simulation, top_up_bullets
+from config import GameConfig
+from game.rollout import random_policy
+from game.simulation import Simulation
+from game.vec_env import SubprocVecEnv, VecEnv
+
+PHASES = Simulation.phases
+
+SWEEPS = {
+    "bots": [{"bots": count} for count in (4, 50, 200, 1000)],
+    "bullets": [{"bullets": count} for count in (0, 100, 1000, 4000)],
+    "map": [
+        {"map_size": (1600, 900), "platforms": 14},
+        {"map_size": (8000, 3000), "platforms": 450},
+        {"map_size": (40000, 6000), "platforms": 4500},
+    ],
+    "envs": [{"num_envs": count} for count in (1, 2, 4, 8)],
+    "sense": [{"rays": 64, "bots": 100, "bullets": count} for count in (0, 300, 1000)],
+}
+
+# Time one frame may take at the game's frame rate
+FRAME_SECONDS = 1 / GameConfig().fps
+
+
+def _tick(simulation: Simulation, phase_time: dict[str, float]) -> None:
+    for phase in PHASES:
+        start = time.perf_counter()
+        getattr(simulation, phase)()
+        phase_time[phase] += time.perf_counter() - start
+    simulation.clock.advance()
+
+
+def measure_simulation(
+    ticks: int = 300,
+    memory_ticks: int = 50,
+    warmup: int = 20,
+    bullets: int = 0,
+    seed: int = 0,
+    **scenario,
+) -> dict:
+    """
+    Runs one scenario (see `build_simulation`) with `bullets` kept in
+    flight. Timing and memory are measured in separate passes because
+    tracing allocations slows the game down.
+    """
+    start = time.perf_counter()
+    simulation = build_simulation(seed=seed, **scenario)
+    setup_seconds = time.perf_counter() - start
+    rng = np.random.default_rng(seed)
+
+    phase_time = dict.fromkeys(PHASES, 0.0)
+    for _ in range(warmup):
+        top_up_bullets(simulation, bullets, rng)
+        _tick(simulation, phase_time)
+
+    phase_time = dict.fromkeys(PHASES, 0.0)
+    for _ in range(ticks):
+        top_up_bullets(simulation, bullets, rng)
+        _tick(simulation, phase_time)
+    tick_seconds = sum(phase_time.values())
+
+    tracemalloc.start()
+    transient_bytes = 0
+    blocks = sys.getallocatedblocks()
+    for _ in range(memory_ticks):
+        top_up_bullets(simulation, bullets, rng)
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        _tick(simulation, dict.fromkeys(PHASES, 0.0))
+        _, peak = tracemalloc.get_traced_memory()
+        transient_bytes += peak - before
+    blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+
+    return {
+        "setup_seconds": setup_seconds,
+        "ticks": ticks,
+        "ticks_per_second": ticks / tick_seconds,
+        "phase_seconds_per_tick": {name: value / ticks for name, value in phase_time.items()},
+        "entities": len(simulation.entities),
+        # Obstacles besides the floor, as placed rather than as asked for
+        "platforms": len(simulation.map.obstacles) - 1,
+        "bullets_in_flight": simulation.bullet_pool.in_flight,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "transient_bytes_per_tick": transient_bytes / memory_ticks,
+        "net_blocks_per_tick": blocks / memory_ticks,
+    }
+
+
+def measure_vec_env(
+    num_envs: int,
+    ticks: int = 300,
+    array_backed: bool = False,
+    subprocess: bool = False,
+    seed: int = 0,
+) -> dict:
+    """
+    Steps `num_envs` environments in lockstep with random actions.
+    """
+    env_fns = [
+        functools.partial(Simulation, array_backed=array_backed, seed=seed + index)
+        for index in range(num_envs)
+    ]
+    np.random.seed(seed)
+    vec_env = (SubprocVecEnv if subprocess else VecEnv)(env_fns)
+    try:
+        observations = vec_env.reset()
+        start = time.perf_counter()
+        for _ in range(ticks):
+            observations, _, _, _ = vec_env.step(random_policy(observations))
+        seconds = time.perf_counter() - start
+    finally:
+        vec_env.close()
+    return {
+        "ticks": ticks,
+        "ticks_per_second": ticks / seconds,
+        "env_steps_per_second": num_envs * ticks / seconds,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def measure_sensing(
+    rays: int,
+    ticks: int = 300,
+    max_distance: float = 600.0,
+    warmup: int = 20,
+    bullets: int = 0,
+    seed: int = 0,
+    **scenario,
+) -> dict:
+    """
+    Casts `rays` rays from every bot once per tick with `bullets` kept in
+    flight, timing only the `Simulation.sense` calls.
+    """
+    simulation = build_simulation(seed=seed, **scenario)
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, rays, endpoint=False)
+    for _ in range(warmup):
+        top_up_bullets(simulation, bullets, rng)
+        simulation.next_step()
+
+    seconds = 0.0
+    for _ in range(ticks):
+        top_up_bullets(simulation, bullets, rng)
+        simulation.next_step()
+        start = time.perf_counter()
+        simulation.sense(simulation.bots, angles, max_distance)
+        seconds += time.perf_counter() - start
+    return {
+        "ticks": ticks,
+        "sense_seconds": seconds / ticks,
+        "within_frame": seconds / ticks <= FRAME_SECONDS,
+        "entities": len(simulation.entities),
+        "bullets_in_flight": simulation.bullet_pool.in_flight,
+    }
+
+
+def run_case(case: dict, array_backed: bool, ticks: int, subprocess: bool) -> dict:
+    case = dict(case)
+    if "rays" in case:
+        return measure_sensing(ticks=ticks, array_backed=array_backed, **case)
+    if "num_envs" in case:
+        return measure_vec_env(
+            case["num_envs"], ticks, array_backed=array_backed, subprocess=subprocess
+        )
+    return measure_simulation(ticks=ticks, array_backed=array_backed, **case)
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--sweep", action="append", choices=sorted(SWEEPS),
+        help="sweep to run, can be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--backend", choices=("object", "array", "both"), default="both",
+        help="entity storage to benchmark",
+    )
+    parser.add_argument("--ticks", type=int, default=300)
+    parser.add_argument(
+        "--subprocess", action="store_true",
+        help="run the envs sweep with one process per environment",
+    )
+    parser.add_argument("--output", help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    backends = {"object": [False], "array": [True], "both": [False, True]}[args.backend]
+    results = []
+    for sweep in args.sweep or list(SWEEPS):
+        for case in SWEEPS[sweep]:
+            for array_backed in backends:
+                metrics = run_case(case, array_backed, args.ticks, args.subprocess)
+                result = {
+                    "sweep": sweep,
+                    "backend": "array" if array_backed else "object",
+                    "params": case,
+                    **metrics,
+                }
+                results.append(result)
+                params = " ".join(f"{key}={value}" for key, value in case.items())
+                if "sense_seconds" in metrics:
+                    budget = "" if metrics["within_frame"] else " over frame budget"
+                    score = f"{metrics['sense_seconds'] * 1000:10.2f} ms/sense{budget}"
+                else:
+                    score = f"{metrics['ticks_per_second']:10.1f} ticks/s"
+                print(f"{sweep:8} {result['backend']:6} {params:40} {score}", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"environment": environment(), "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import math
+
+import numpy as np
+
+from characters.bots import Bot
+from config import MapConfig
+from game.simulation import Simulation
+from map.generator import generate_map
+
+# Health given to the player so a benchmark is never cut short by dying
+UNKILLABLE = 1e12
+
+
+def build_simulation(
+    bots: int = 4,
+    map_size: tuple[int, int] | None = None,
+    platforms: int = 0,
+    array_backed: bool = False,
+    seed: int = 0,
+) -> Simulation:
+    """
+    A headless simulation with at least `bots` flying bots. With `map_size`
+    it is played on a generated map with `platforms` platforms, otherwise on
+    the built-in level.
+    """
+    game_map = None
+    if map_size is not None:
+        width, height = map_size
+        game_map = generate_map(MapConfig(width=width, height=height), platforms, seed)
+    simulation = Simulation(array_backed=array_backed, seed=seed, game_map=game_map)
+    simulation.draw_graphics = False
+    simulation.player.health = UNKILLABLE
+    for _ in range(bots - len(simulation.bots)):
+        bot = Bot(simulation.player, simulation.rng, simulation.settings)
+        bot.brain = simulation.chase_brain
+        simulation.bots.append(bot)
+        simulation.add_entity(bot)
+    return simulation
+
+
+def top_up_bullets(simulation: Simulation, target: int, rng: np.random.Generator) -> None:
+    """
+    Fires player bullets in random directions until `target` are in flight.
+    """
+    missing = target - simulation.bullet_pool.in_flight
+    for direction in rng.uniform(0, 2 * math.pi, size=max(missing, 0)).tolist():
+        simulation.shoot(simulation.player, direction)
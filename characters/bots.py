@@ -1,23 +1,31 @@
 import numpy as np
 import pygame
-from map.map import Map
 from characters.player import Player
 import characters.entity as ent
 from characters.bullet import Bullet
-from random import randint, random
+from game.clock import SimulationClock
 import math
 #from icecream import ic
 
-from config import BotConfig, MapConfig, SprinterBotConfig, WindowConfig
+from config import BotConfig, GameSettings, PlanningBotConfig, SprinterBotConfig, WindowConfig
 
 
 class Bot(ent.Entity):
-    def __init__(self, player: Player) -> None:
-        super().__init__()
+    state_fields = {**ent.Entity.state_fields, "spawn_distance_from_player": float}
+    object_fields = ("brain",)
+    reference_fields = ("_player",)
+
+    def __init__(
+        self,
+        player: Player,
+        rng: np.random.Generator | None = None,
+        settings: GameSettings | None = None,
+    ) -> None:
+        super().__init__(rng, settings)
         self.config = BotConfig()
         self._player: Player = player
         self.type: str = "default"
-        self.obstacles = Map().obstacles
+        self.brain = None
         self.collision_layer = ent.CollisionLayers.BOT
         self.collision_interactions = {ent.CollisionLayers.BULLET : ent.CollisionInteractions.HURT,
                                        ent.CollisionLayers.GROUND : ent.CollisionInteractions.SACRIFICE,
@@ -26,8 +34,12 @@ class Bot(ent.Entity):
 
         # Choosing where to spawn
         while True:
-            self.x: int = randint(-WindowConfig().width, WindowConfig().width)
-            self.y: int = randint(-WindowConfig().height, WindowConfig().height)
+            self.x: int = int(
+                self.rng.integers(-WindowConfig().width, WindowConfig().width, endpoint=True)
+            )
+            self.y: int = int(
+                self.rng.integers(-WindowConfig().height, WindowConfig().height, endpoint=True)
+            )
             self.spawn_distance_from_player: float = np.sqrt(
                 (
                     self.x
@@ -45,21 +57,12 @@ class Bot(ent.Entity):
                 ** 2
             )
             if (
-                self.config.max_spawn_radius
+                self.settings.bot_max_spawn_radius
                 >= self.spawn_distance_from_player
-                >= self.config.min_spawn_radius
+                >= self.settings.bot_min_spawn_radius
             ):
                 break
 
-    def _get_vector_to_player_parameters(self, bot_width, bot_height) -> np.ndarray:
-        vector_to_player: np.ndarray = np.array(
-            [
-                self.x + bot_width / 2 - (self._player.x + self._player.width / 2),
-                self.y + bot_height / 2 - (self._player.y + self._player.height / 2),
-            ]
-        )
-        return vector_to_player
-
     def is_colliding(
         self,
         future_x: float,
@@ -82,59 +85,97 @@ class Bot(ent.Entity):
         return False
 
     def spawn(self):
-        x = randint(0, MapConfig().width - self.width)
+        x = int(self.rng.integers(0, self.settings.map_width - self.width, endpoint=True))
         self.x = x
         self.y = 0
+        self.health = self.config.health
 
     def die(self):
         self.spawn()
 
-    def move_to_player(self):
-        vector: np.ndarray = self._get_vector_to_player_parameters(
-            self.config.height, self.config.height
-        )
-
-        # Random movement, but most likely towards player
-        angle = np.random.normal(0, 80)
-        angle_rad = math.radians(angle)
-
-        dx, dy = vector
-        cos_theta, sin_theta = math.cos(angle_rad), math.sin(angle_rad)
-        rotated_vector = np.array(
-            [
-                dx * cos_theta - dy * sin_theta,
-                dx * sin_theta + dy * cos_theta,
-            ]
-        )
+    def apply_action(self, action):
+        """
+        Bots fly, so the first two action entries are read as a heading.
+        """
+        type(self).apply_actions([self], np.asarray(action, dtype=float).reshape(1, -1))
 
-        rotated_vector_normalized = rotated_vector / np.linalg.norm(rotated_vector)
-        new_x = self.x - rotated_vector_normalized[0] * self.config.speed
-        new_y = self.y - rotated_vector_normalized[1] * self.config.speed
+    @classmethod
+    def apply_actions(cls, agents: list, actions) -> None:
+        speed = np.full(len(agents), agents[0].config.speed)
+        cls.step_towards(agents, actions[:, 0], actions[:, 1], speed)
 
-        if self.is_colliding(new_x, new_y):
-            self.die()
+    @staticmethod
+    def step_towards(agents: list, heading_x, heading_y, speed) -> np.ndarray:
+        """
+        Moves each bot by its `speed` along its heading, all at once. The
+        bots share one type and player. Bots that would hit the player die
+        instead; they are flagged in the returned array.
+        """
+        heading_x = np.asarray(heading_x, dtype=float)
+        heading_y = np.asarray(heading_y, dtype=float)
+        player = agents[0]._player
+        store = getattr(agents[0], "_store", None)
+        if store is not None:
+            try:
+                slots = np.fromiter((bot._slot for bot in agents), np.intp, len(agents))
+            except AttributeError:
+                store = None
+        if store is not None:
+            x, y = store.x[slots], store.y[slots]
+        else:
+            x = np.array([bot.x for bot in agents], dtype=float)
+            y = np.array([bot.y for bot in agents], dtype=float)
+
+        norm = np.hypot(heading_x, heading_y)
+        moving = norm != 0
+        norm[~moving] = 1
+        new_x = x + heading_x / norm * speed
+        new_y = y + heading_y / norm * speed
+
+        # Same test as `is_colliding`, including pygame.Rect truncating to ints
+        config = agents[0].config
+        bot_left, bot_top = np.trunc(new_x), np.trunc(new_y)
+        player_left, player_top = math.trunc(player.x), math.trunc(player.y)
+        colliding = moving & (
+            (bot_left < player_left + player.width)
+            & (player_left < bot_left + config.width)
+            & (bot_top < player_top + player.height)
+            & (player_top < bot_top + config.height)
+        )
+        moved = moving & ~colliding
+        if store is not None:
+            store.x[slots[moved]] = new_x[moved]
+            store.y[slots[moved]] = new_y[moved]
         else:
-            self.x = new_x
-            self.y = new_y
-            
+            for index in np.flatnonzero(moved).tolist():
+                agents[index].x = float(new_x[index])
+                agents[index].y = float(new_y[index])
+        for index in np.flatnonzero(colliding).tolist():
+            agents[index].die()
+        return colliding
+
     def shoot(self, direction, mode="single"):
         return Bullet(self,
             direction,
             mode,
             )
-    
-    def random_shoot(self):
-        return self.shoot(random() * 2 * math.pi)
-        
-    def update(self):
-        self.move_to_player()
-
 
 
 class BotSprinter(Bot):
-    def __init__(self, player: Player) -> None:
-        super().__init__(player)
+    state_fields = {**Bot.state_fields, "current_speed": float, "moving": bool}
+    object_fields = Bot.object_fields + ("start_time",)
+    simulation_fields = ent.Entity.simulation_fields + ("clock",)
+
+    def __init__(
+        self,
+        player: Player,
+        clock: SimulationClock | None = None,
+        rng: np.random.Generator | None = None,
+        settings: GameSettings | None = None,
+    ) -> None:
+        super().__init__(player, rng, settings)
         self.config = SprinterBotConfig()
+        self.clock = clock if clock is not None else SimulationClock()
         self.type: str = "sprinter"
         self.start_time = None
         self.current_speed = 0
@@ -152,65 +193,66 @@ class BotSprinter(Bot):
             ),
         )
 
-    def move_to_player(self):
-        if self.start_time is None or not self.moving:
-            self.start_time = pygame.time.get_ticks()
-            self.current_speed = 0
-            self.moving = True
-        elapsed_time = (pygame.time.get_ticks() - self.start_time) / 1000
-
-        # Acceleration
-        if elapsed_time < self.config.time_to_max_speed:
-            self.current_speed = self.config.speed * (
-                elapsed_time / self.config.time_to_max_speed
-            )
-        else:
-            self.current_speed = self.config.speed
-
-        vector: np.ndarray = self._get_vector_to_player_parameters(
-            self.config.width, self.config.height
-        )
-        vector_normalized = vector / np.linalg.norm(vector)
-
-        new_x = self.x - vector_normalized[0] * self.current_speed
-        new_y = self.y - vector_normalized[1] * self.current_speed
-
-        if self.is_colliding(new_x, new_y):
-            self.moving = False
-            self.die()
-        else:
-            self.x = new_x
-            self.y = new_y
-            
+    @classmethod
+    def apply_actions(cls, agents: list, actions) -> None:
+        # Acceleration timers are kept per sprinter
+        speed = np.empty(len(agents))
+        for index, bot in enumerate(agents):
+            if bot.start_time is None or not bot.moving:
+                bot.start_time = bot.clock.time
+                bot.current_speed = 0
+                bot.moving = True
+            elapsed_time = bot.clock.time - bot.start_time
+
+            # Acceleration
+            if elapsed_time < bot.config.time_to_max_speed:
+                bot.current_speed = bot.config.speed * (
+                    elapsed_time / bot.config.time_to_max_speed
+                )
+            else:
+                bot.current_speed = bot.config.speed
+            speed[index] = bot.current_speed
 
-            
+        collided = cls.step_towards(agents, actions[:, 0], actions[:, 1], speed)
+        for index in np.flatnonzero(collided).tolist():
+            agents[index].moving = False
 
 
 class PlayerLikeBot(Player):
-    def __init__(self):
-        super().__init__()
+    state_fields = {**Player.state_fields, "going_right": bool}
+    object_fields = ("brain",)
+
+    def __init__(
+        self,
+        rng: np.random.Generator | None = None,
+        settings: GameSettings | None = None,
+    ):
+        super().__init__(rng, settings)
         self.config = BotConfig()
         self.x = 100
         self.y = 30
         self.going_right = False
+        self.brain = None
         self.collision_layer = ent.CollisionLayers.BOT
         self.collision_interactions = {ent.CollisionLayers.BULLET : ent.CollisionInteractions.HURT,
                                        ent.CollisionLayers.GROUND : ent.CollisionInteractions.STAND}
 
-    def random_movement(self):
-        if randint(0, 50) == 1:
-            self.going_right = not self.going_right
-        if randint(0, 1):
-            self.move(self.going_right)
-        if randint(0, 10) == 1:
-            self.jump()
 
-    def random_shoot(self):
-        return self.shoot(random() * 2 * math.pi)
+class PlanningBot(PlayerLikeBot):
+    """
+    Walks, jumps and shoots like the player. Meant to be driven by a
+    `PlanningBrain`.
+    """
+
+    def __init__(
+        self,
+        rng: np.random.Generator | None = None,
+        settings: GameSettings | None = None,
+    ):
+        super().__init__(rng, settings)
+        self.config = PlanningBotConfig()
+        self.x = float(self.rng.uniform(self.width / 2, self.settings.map_width - self.width / 2))
 
-    def update(self):
-        self.random_movement()
-        super().update()
 
 def main() -> None:
     bot_sprinter = BotSprinter(Player())
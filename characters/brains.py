@@ -0,0 +1,168 @@
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from config import PlannerConfig
+from game.forward_model import ForwardModel
+from game.observation import ObservationBuilder
+
+# Position of the nearest opponent in an observation, see `ObservationBuilder`.
+_OPPONENT_DX = ObservationBuilder.self_size
+_OPPONENT_DY = ObservationBuilder.self_size + 1
+_OPPONENT_PRESENT = ObservationBuilder.self_size + 3
+
+
+class Brain(ABC):
+    """
+    Decides the actions of a batch of bots in one call.
+
+    `act` gets one observation row per agent and returns one
+    `(move, jump, shoot, aim)` action row per agent. Flying bots read the
+    first two entries of their action as a heading instead. Any randomness
+    has to come from `rng`, the simulation's generator. Only the
+    `observation_blocks` a brain reads are computed, the rest are zero.
+    """
+
+    action_size = 4
+    observation_blocks: tuple[str, ...] = ObservationBuilder.blocks
+
+    def gather(self, simulation) -> None:
+        """
+        Called with the simulation once per tick before `act`, for brains
+        that look at more of the game than the observations.
+        """
+
+    @abstractmethod
+    def act(
+        self, observations: np.ndarray, agents: list, rng: np.random.Generator
+    ) -> np.ndarray:
+        pass
+
+
+class ChaseBrain(Brain):
+    """
+    Flies towards the nearest opponent with the heading rotated by normally
+    distributed noise, and shoots in a random direction now and then.
+    """
+
+    def __init__(self, noise_degrees: float = 80, shoot_chance: float = 1 / 11):
+        self.noise_degrees = noise_degrees
+        self.shoot_chance = shoot_chance
+
+    observation_blocks = ("opponents",)
+
+    def act(
+        self, observations: np.ndarray, agents: list, rng: np.random.Generator
+    ) -> np.ndarray:
+        count = len(observations)
+        actions = np.zeros((count, self.action_size))
+        settings = agents[0].settings
+        heading_x = observations[:, _OPPONENT_DX] * settings.map_width
+        heading_y = observations[:, _OPPONENT_DY] * settings.map_height
+        if self.noise_degrees:
+            # Random movement, but most likely towards the opponent
+            angle = np.radians(rng.normal(0, self.noise_degrees, count))
+            cos_theta, sin_theta = np.cos(angle), np.sin(angle)
+            heading_x, heading_y = (
+                heading_x * cos_theta - heading_y * sin_theta,
+                heading_x * sin_theta + heading_y * cos_theta,
+            )
+        present = observations[:, _OPPONENT_PRESENT] > 0
+        actions[:, 0] = np.where(present, heading_x, 0)
+        actions[:, 1] = np.where(present, heading_y, 0)
+        actions[:, 2] = rng.random(count) < self.shoot_chance
+        actions[:, 3] = rng.random(count) * 2 * np.pi
+        return actions
+
+
+class RandomBrain(Brain):
+    """
+    Walks in one direction, turning around and jumping at random, and shoots
+    in a random direction now and then.
+    """
+
+    def __init__(
+        self,
+        turn_chance: float = 1 / 51,
+        move_chance: float = 1 / 2,
+        jump_chance: float = 1 / 11,
+        shoot_chance: float = 1 / 11,
+    ):
+        self.turn_chance = turn_chance
+        self.move_chance = move_chance
+        self.jump_chance = jump_chance
+        self.shoot_chance = shoot_chance
+
+    observation_blocks = ()
+
+    def act(
+        self, observations: np.ndarray, agents: list, rng: np.random.Generator
+    ) -> np.ndarray:
+        count = len(observations)
+        actions = np.zeros((count, self.action_size))
+        going_right = np.array([agent.going_right for agent in agents], dtype=bool)
+        going_right ^= rng.random(count) < self.turn_chance
+        for agent, right in zip(agents, going_right.tolist()):
+            agent.going_right = right
+        moving = rng.random(count) < self.move_chance
+        actions[:, 0] = np.where(moving, np.where(going_right, 1, -1), 0)
+        actions[:, 1] = rng.random(count) < self.jump_chance
+        actions[:, 2] = rng.random(count) < self.shoot_chance
+        actions[:, 3] = rng.random(count) * 2 * np.pi
+        return actions
+
+
+class PlanningBrain(Brain):
+    """
+    Tries every combination of moving left, right or not at all, jumping
+    and shooting at the player, rolls each one out with a `ForwardModel`
+    and takes the best.
+
+    The rollouts of all agents go one tick deeper at a time, so planning
+    can stop at any depth. By default it always looks `horizon` ticks
+    ahead, so seeded games are reproducible. With a `budget_ms`, as the
+    `Renderer` sets, it stops once this tick's budget is used up and games
+    are only reproducible as long as the budget is never hit.
+    """
+
+    moves = np.array([0, -1, 1, 0, -1, 1] * 2)
+    jumps = np.array([0, 0, 0, 1, 1, 1] * 2)
+    shots = np.array([0] * 6 + [1] * 6)
+    # Everything is read from the forward model instead
+    observation_blocks = ()
+
+    def __init__(self, config: PlannerConfig = PlannerConfig()):
+        self.config = config
+        self.model = ForwardModel(config)
+        # How many ticks ahead the last call looked
+        self.depth = 0
+
+    def gather(self, simulation) -> None:
+        self.model.load(simulation)
+
+    def act(
+        self, observations: np.ndarray, agents: list, rng: np.random.Generator
+    ) -> np.ndarray:
+        config = self.config
+        model = self.model
+        deadline = None
+        if config.budget_ms is not None:
+            deadline = time.perf_counter() + config.budget_ms / 1000
+        model.begin(agents, self.moves, self.jumps, self.shots)
+        while model.depth < config.horizon:
+            model.advance()
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        self.depth = model.depth
+
+        # Ties go to the first candidate, which stands still
+        candidates = len(self.moves)
+        best = np.argmax(model.scores.reshape(len(agents), candidates), axis=1)
+        rows = np.arange(len(agents)) * candidates + best
+        actions = np.zeros((len(agents), self.action_size))
+        actions[:, 0] = self.moves[best]
+        actions[:, 1] = self.jumps[best]
+        actions[:, 2] = self.shots[best]
+        actions[:, 3] = model.aims[rows]
+        return actions
@@ -1,6 +1,5 @@
 import pygame
 import math
-import random
 import characters.entity as ent
 
 from config import BulletConfig, BotConfig
@@ -8,48 +7,90 @@ from config import BulletConfig, BotConfig
 
 
 class Bullet(ent.Entity):
+    # Shared by all bullets, they are never mutated
+    player_interactions = {ent.CollisionLayers.BOT : ent.CollisionInteractions.SACRIFICE,
+                           ent.CollisionLayers.GROUND : ent.CollisionInteractions.SACRIFICE}
+    bot_interactions = {ent.CollisionLayers.PLAYER : ent.CollisionInteractions.SACRIFICE,
+                        ent.CollisionLayers.GROUND : ent.CollisionInteractions.SACRIFICE}
+
+    state_fields = {
+        **ent.Entity.state_fields,
+        "step_x": float,
+        "step_y": float,
+        "speed": float,
+        "direction": float,
+    }
+    # The layer depends on who fired the bullet
+    object_fields = ("collision_layer", "collision_interactions")
+    reference_fields = ("author",)
 
     def __init__(self, author, direction, mode="single"):
-        super().__init__()
-        self.author = author
-        self.x = author.x
-        self.y = author.y
-        self.speed = BulletConfig().speed
-        self.damage = BulletConfig().damage
-        self.radius = BulletConfig().radius
-        self.direction = direction
+        super().__init__(author.rng, author.settings)
         self.config = BulletConfig()
-        
+        self.damage = self.config.damage
+        self.radius = self.config.radius
         self.size = [2*self.radius,2*self.radius]
 
         self.bot_width = BotConfig().width
         self.bot_height = BotConfig().height
+        self.fire(author, direction, mode)
+
+    def fire(self, author, direction, mode="single"):
+        """
+        (Re)starts the bullet from `author`, so pooled bullets can be reused
+        without building a new object.
+        """
+        self.author = author
+        self.rng = author.rng
+        self.settings = author.settings
+        self.x = author.x
+        self.y = author.y
+        self.queued_for_deletion = False
+        self.speed = self.config.speed
+        self.direction = direction
+
         if author.collision_layer == ent.CollisionLayers.PLAYER:
             self.collision_layer = ent.CollisionLayers.BULLET
-            self.collision_interactions = {ent.CollisionLayers.BOT : ent.CollisionInteractions.SACRIFICE}
+            self.collision_interactions = self.player_interactions
         else:
             self.collision_layer = ent.CollisionLayers.BULLET_BOT
-            self.collision_interactions = {ent.CollisionLayers.PLAYER : ent.CollisionInteractions.SACRIFICE}
-            
-        self.collision_interactions[ent.CollisionLayers.GROUND] = ent.CollisionInteractions.SACRIFICE
+            self.collision_interactions = self.bot_interactions
 
         if mode == "shotgun":
             spread_angle = 0.2  # value in radians (1 radian = 57.2958 degrees)
-            self.direction += random.uniform(-spread_angle, spread_angle)
+            self.direction += self.rng.uniform(-spread_angle, spread_angle)
             self.speed -= 4
 
+        self.step_x = math.cos(self.direction) * self.speed
+        self.step_y = math.sin(self.direction) * self.speed
+
     def update(self):
-        self.x += math.cos(self.direction) * self.speed
-        self.y += math.sin(self.direction) * self.speed
+        self.x += self.step_x
+        self.y += self.step_y
+
+    @classmethod
+    def batch_update(cls, store, slots):
+        store.x[slots] += store.step_x[slots]
+        store.y[slots] += store.step_y[slots]
 
     def draw(self, screen: pygame.Surface, offset_x=0, offset_y=0):
         pygame.draw.circle(
             screen,
-            BulletConfig().color,
+            self.config.color,
             (int(self.x - offset_x), int(self.y - offset_y)),
-            BulletConfig().radius,
+            self.radius,
         )
 
+    def sprite(self) -> tuple[pygame.Surface, float, float]:
+        side = 2 * self.radius + 1
+        surface = pygame.Surface((side, side))
+        # Any colour other than the bullet's works as the transparent key
+        key = (0, 0, 0) if self.config.color != (0, 0, 0) else (255, 255, 255)
+        surface.fill(key)
+        surface.set_colorkey(key)
+        pygame.draw.circle(surface, self.config.color, (self.radius, self.radius), self.radius)
+        return surface, -self.radius, -self.radius
+
     def check_bullet_collision_with_object(self, obj):
         if self.author == obj:
             return False
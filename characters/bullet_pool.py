@@ -0,0 +1,55 @@
+from characters.bullet import Bullet
+from config import BulletConfig
+
+
+class BulletPool:
+    """
+    Fixed-capacity pool of reusable bullets.
+
+    Bullets are only built until `capacity` exist; after that, released
+    bullets are handed out again from a free list, so steady firing
+    allocates nothing. When every bullet is in flight the shot is dropped.
+    """
+
+    def __init__(self, capacity: int = BulletConfig().pool_capacity):
+        self.capacity = capacity
+        self.allocated = 0
+        self._free: list[Bullet] = []
+
+    @property
+    def in_flight(self) -> int:
+        return self.allocated - len(self._free)
+
+    def acquire(self, author, direction: float, mode: str = "single") -> Bullet | None:
+        if self._free:
+            bullet = self._free.pop()
+            bullet.fire(author, direction, mode)
+            return bullet
+        if self.allocated < self.capacity:
+            self.allocated += 1
+            return Bullet(author, direction, mode)
+        return None
+
+    def release(self, bullet: Bullet) -> None:
+        # Drop the author reference so dead bullets do not keep it alive
+        bullet.author = None
+        self._free.append(bullet)
+
+    def drain(self) -> list[Bullet]:
+        """
+        Takes every free bullet out of the pool.
+        """
+        free = self._free
+        self._free = []
+        self.allocated -= len(free)
+        return free
+
+    def restore(self, in_flight: int, spare: list[Bullet]) -> None:
+        """
+        Sets the pool up as if `in_flight` of its bullets were in use, and
+        keeps as many `spare` bullets as the capacity leaves room for.
+        """
+        self._free = spare[: max(self.capacity - in_flight, 0)]
+        for bullet in self._free:
+            bullet.author = None
+        self.allocated = in_flight + len(self._free)
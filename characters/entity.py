@@ -1,5 +1,8 @@
+import math
+
+import numpy as np
 import pygame
-from config import DefaultEntityConfig, MapConfig
+from config import DEFAULT_SETTINGS, DefaultEntityConfig, GameSettings
 #from characters.bullet import Bullet
 from enum import Enum, Flag
 
@@ -19,15 +22,56 @@ class CollisionInteractions(Flag):
     SACRIFICE = 4
     BLOCK = 8
 
+_layer_bits_cache: dict[int, tuple[int, ...]] = {}
+
+
+def _layer_bits(mask: int) -> tuple[int, ...]:
+    bits = _layer_bits_cache.get(mask)
+    if bits is None:
+        bits = _layer_bits_cache[mask] = tuple(
+            1 << bit for bit in range(mask.bit_length()) if mask & (1 << bit)
+        )
+    return bits
+
+
+# Used by entities created without a generator of their own.
+_default_rng = np.random.default_rng()
+
+
 class Entity:
-    def __init__(self):
-        self.x = DefaultEntityConfig().start_x
-        self.y = DefaultEntityConfig().start_y
-        self.velocity_y = 0
-        self.health = DefaultEntityConfig().health
-        self.width = DefaultEntityConfig().width
-        self.height = DefaultEntityConfig().height
+    is_static: bool = False
+
+    # What `Simulation.snapshot` saves of each entity: numbers that change
+    # while the game runs, other per-entity values, references to other
+    # entities (saved as ids) and attributes shared with the simulation,
+    # which are rebound on restore. Everything else is the same for every
+    # entity of a type.
+    state_fields: dict[str, type] = {
+        "x": float,
+        "y": float,
+        "velocity_y": float,
+        "health": float,
+        "is_falling": bool,
+        "queued_for_deletion": bool,
+    }
+    object_fields: tuple[str, ...] = ()
+    reference_fields: tuple[str, ...] = ()
+    simulation_fields: tuple[str, ...] = ("rng", "settings")
+
+    def __init__(
+        self,
+        rng: np.random.Generator | None = None,
+        settings: GameSettings | None = None,
+    ):
+        self.rng = rng if rng is not None else _default_rng
+        self.settings = settings if settings is not None else DEFAULT_SETTINGS
         self.config = DefaultEntityConfig()
+        self.x = self.config.start_x
+        self.y = self.config.start_y
+        self.velocity_y = 0
+        self.health = self.config.health
+        self.width = self.config.width
+        self.height = self.config.height
         self.size = [self.width,self.height]
 
         self.collision_layer = CollisionLayers.NONE
@@ -38,7 +82,30 @@ class Entity:
         self.damage = 0
         self.mass = 1
 
-
+    @property
+    def collision_layer(self) -> CollisionLayers:
+        return self._collision_layer
+
+    @collision_layer.setter
+    def collision_layer(self, layer: CollisionLayers):
+        self._collision_layer = layer
+        self.occupied_mask: int = layer.value
+        self.occupied_layers = _layer_bits(layer.value)
+
+    @property
+    def collision_interactions(self) -> dict:
+        return self._collision_interactions
+
+    @collision_interactions.setter
+    def collision_interactions(self, interactions: dict):
+        # Masks are computed on assignment, so interactions have to be
+        # reassigned as a whole rather than mutated in place.
+        self._collision_interactions = interactions
+        mask = 0
+        for layer in interactions:
+            mask |= layer.value
+        self.reacts_to_mask: int = mask
+        self.reacts_to_layers = _layer_bits(mask)
 
     def draw(self, screen, offset_x=0, offset_y=0):
         pygame.draw.rect(
@@ -52,6 +119,17 @@ class Entity:
             ),
         )
 
+    def sprite(self) -> tuple[pygame.Surface, float, float]:
+        """
+        Pre-rendered look of `draw` for batched drawing, with the offset of
+        its top-left corner from the entity position. The renderer makes one
+        per type, so all entities of a type have to look the same.
+        """
+        width, height = self.size
+        surface = pygame.Surface((math.ceil(width), math.ceil(height)))
+        surface.fill(self.config.color)
+        return surface, -width / 2, -height / 2
+
     def reduce_health(self, damage: float):
         if self.health - damage <= 0:
             self.health = 0
@@ -68,7 +146,26 @@ class Entity:
 
     def update(self):
         pass
-        
+
+    @classmethod
+    def batch_update(cls, store, slots):
+        """
+        Updates every entity of this type held in the array-backed `store`.
+        Types without a vectorized update fall back to calling `update` on each.
+        """
+        entities = store.entities
+        for slot in slots:
+            entities[slot].update()
+
+    @classmethod
+    def apply_actions(cls, agents: list, actions) -> None:
+        """
+        `apply_action` for a batch of entities of this type, one action row
+        each. Types that can move many entities at once override this.
+        """
+        for agent, action in zip(agents, actions):
+            agent.apply_action(action)
+
     def check_collision(self,other):
         return (abs(self.x-other.x) <= self.size[0]/2 + other.size[0]/2 and
             abs(self.y-other.y) <= self.size[1]/2 + other.size[1]/2)
@@ -99,11 +196,11 @@ class Entity:
 
         
     def delete_if_too_far(self):
-        tolerance = 0.1
-        if (self.x < 0 - MapConfig().width*tolerance or
-            self.y < 0 - MapConfig().height*tolerance or
-            self.x >  MapConfig().width*(1+tolerance) or
-            self.y >  MapConfig().height*(1+tolerance)):
+        settings = self.settings
+        if (self.x < settings.despawn_min_x or
+            self.y < settings.despawn_min_y or
+            self.x > settings.despawn_max_x or
+            self.y > settings.despawn_max_y):
             self.queued_for_deletion = True
             
                     
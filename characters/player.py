@@ -1,19 +1,19 @@
-from config import MapConfig, PlayerConfig, PhysicsConfig
+from config import PlayerConfig
 import characters.entity as ent
 from characters.bullet import Bullet
 
 class Player(ent.Entity):
-    def __init__(self):
-        super().__init__()
-        self.x = PlayerConfig().start_x
-        self.y = PlayerConfig().start_y
+    def __init__(self, rng=None, settings=None):
+        super().__init__(rng, settings)
+        self.config = PlayerConfig()
+        self.x = self.config.start_x
+        self.y = self.config.start_y
         self.velocity_y: float = 0
         self.is_falling = False
-        self.health = PlayerConfig().health
-        self.width = PlayerConfig().width
-        self.height = PlayerConfig().height
-        self.config = PlayerConfig()
-        self.color = PlayerConfig().color
+        self.health = self.config.health
+        self.width = self.config.width
+        self.height = self.config.height
+        self.color = self.config.color
         self.size = [self.width,self.height]
         self.collision_layer = ent.CollisionLayers.PLAYER
         self.collision_interactions = {ent.CollisionLayers.GROUND : ent.CollisionInteractions.STAND,
@@ -21,13 +21,13 @@ class Player(ent.Entity):
             }
 
     def move(self, right: bool):
-        new_x = self.x + PlayerConfig().speed * (1 if right else -1)
-        if 0 + self.width/2 <= new_x <= MapConfig().width - self.width/2:
+        new_x = self.x + self.settings.player_speed * (1 if right else -1)
+        if 0 + self.width/2 <= new_x <= self.settings.map_width - self.width/2:
             self.x = new_x
 
     def jump(self):
         if not self.is_falling:
-            self.velocity_y = PlayerConfig().initial_jump_velocity
+            self.velocity_y = self.settings.player_jump_velocity
             self.is_falling = True
 
     def apply_y_movement(self):
@@ -36,8 +36,20 @@ class Player(ent.Entity):
 
     def apply_gravity(self):
         if self.is_falling:
-            self.velocity_y += PhysicsConfig().gravity
+            self.velocity_y += self.settings.gravity
             
+    def apply_action(self, action):
+        """
+        Applies the movement part of a `(move, jump, shoot, aim)` action.
+        """
+        move, jump = action[0], action[1]
+        if move < -0.5:
+            self.move(False)
+        elif move > 0.5:
+            self.move(True)
+        if jump > 0.5:
+            self.jump()
+
     def shoot(self, direction, mode="single"):
         return Bullet(self,
             direction,
@@ -48,3 +60,11 @@ class Player(ent.Entity):
         self.apply_y_movement()
         self.apply_gravity()
         self.is_falling = True
+
+    @classmethod
+    def batch_update(cls, store, slots):
+        falling = slots[store.is_falling[slots]]
+        store.y[falling] += store.velocity_y[falling]
+        store.velocity_y[falling] += store.settings.gravity
+        store.is_falling[slots] = True
+
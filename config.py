@@ -28,8 +28,10 @@ class Color:
 @dataclass(frozen=True)
 class MapConfig:
     bg_color: tuple[int, int, int] = Color().black
-    width = 1600
-    height = 900
+    width: int = 1600
+    height: int = 900
+    collision_cell_size: int = 100
+    despawn_tolerance: float = 0.1  # fraction of the map size
 
 
 @dataclass(frozen=True)
@@ -96,6 +98,22 @@ class SprinterBotConfig(BotConfig):
     time_to_max_speed: int = 3
 
 
+@dataclass(frozen=True)
+class PlanningBotConfig(BotConfig):
+    color: tuple[int, int, int] = Color().light_blue
+
+
+@dataclass(frozen=True)
+class PlannerConfig:
+    horizon: int = 24  # ticks rolled out per candidate action
+    budget_ms: float | None = None  # per tick for all planning bots, None for no cutoff
+    hit_reward: float = 10.0
+    damage_penalty: float = 1.0  # per health point lost
+    death_penalty: float = 1000.0
+    preferred_distance: float = 300
+    distance_penalty: float = 0.01  # per pixel closer or further than preferred
+
+
 @dataclass(frozen=True)
 class BulletConfig:
     color: tuple[int, int, int] = Color().yellow
@@ -104,6 +122,7 @@ class BulletConfig:
     height: int = 10
     speed: int = 15
     damage: int = 10
+    pool_capacity: int = 4096
 
 
 @dataclass(frozen=True)
@@ -120,7 +139,105 @@ class HealthBarConfig:
     offset: int = 40
     font = None
     font_size: int = 20
+
+
+@dataclass(frozen=True)
+class HudConfig:
+    x: int = 10  # from the right edge of the window
+    y: int = 10
+    line_height: int = 18
+    font = None
+    font_size: int = 20
+    color: tuple[int, int, int] = Color().yellow
     
 @dataclass(frozen=True)
 class ObstacleConfig:
     color: tuple[int, int, int] = Color().green
+
+
+@dataclass(frozen=True)
+class MapGeneratorConfig:
+    platform_height: int = 20
+    min_platform_width: int = 100
+    max_platform_width: int = 300
+    min_gap: int = 50  # horizontal space kept free between platforms
+
+
+@dataclass(frozen=True)
+class RewardConfig:
+    kill: float = 1.0
+    damage_taken: float = -1.0  # per full player health lost
+
+
+@dataclass(frozen=True)
+class ObservationConfig:
+    nearest_opponents: int = 4
+    nearest_bullets: int = 8
+    nearest_platforms: int = 4
+
+
+class GameSettings:
+    """
+    The config values read while the game runs, resolved once.
+
+    Building a frozen config dataclass costs about as much as the code that
+    reads it, so a simulation resolves one `GameSettings` up front and
+    shares it with all of its entities. Derived values such as radii and
+    despawn bounds are precomputed here as well.
+    """
+
+    __slots__ = (
+        "map_width",
+        "map_height",
+        "collision_cell_size",
+        "despawn_min_x",
+        "despawn_min_y",
+        "despawn_max_x",
+        "despawn_max_y",
+        "player_speed",
+        "player_jump_velocity",
+        "player_health",
+        "player_radius",
+        "bot_min_spawn_radius",
+        "bot_max_spawn_radius",
+        "bullet_speed",
+        "gravity",
+        "fps",
+        "reward_kill",
+        "reward_damage_taken",
+    )
+
+    def __init__(
+        self,
+        map_config: MapConfig = MapConfig(),
+        player: PlayerConfig = PlayerConfig(),
+        bot: BotConfig = BotConfig(),
+        bullet: BulletConfig = BulletConfig(),
+        physics: PhysicsConfig = PhysicsConfig(),
+        game: GameConfig = GameConfig(),
+        reward: RewardConfig = RewardConfig(),
+    ):
+        self.map_width = map_config.width
+        self.map_height = map_config.height
+        self.collision_cell_size = map_config.collision_cell_size
+        tolerance = map_config.despawn_tolerance
+        self.despawn_min_x = 0 - map_config.width * tolerance
+        self.despawn_min_y = 0 - map_config.height * tolerance
+        self.despawn_max_x = map_config.width * (1 + tolerance)
+        self.despawn_max_y = map_config.height * (1 + tolerance)
+        self.player_speed = player.speed
+        self.player_jump_velocity = player.initial_jump_velocity
+        self.player_health = player.health
+        self.player_radius = float(player.radius)
+        self.bot_min_spawn_radius = float(bot.min_spawn_radius)
+        self.bot_max_spawn_radius = float(bot.max_spawn_radius)
+        self.bullet_speed = bullet.speed
+        self.gravity = physics.gravity
+        self.fps = game.fps
+        self.reward_kill = reward.kill
+        # Damage is taken in health points, the reward is per full health
+        self.reward_damage_taken = reward.damage_taken / player.health
+
+
+# Used by entities created outside a simulation.
+DEFAULT_SETTINGS = GameSettings()
@@ -0,0 +1,22 @@
+from config import GameConfig
+
+
+class SimulationClock:
+    """
+    Fixed-timestep clock advanced once per simulation tick.
+
+    Game time is derived from the tick count alone, so it does not depend on
+    wall-clock time or on pygame being initialized.
+    """
+
+    def __init__(self, fps: int = GameConfig().fps):
+        self.fps = fps
+        self.tick = 0
+
+    @property
+    def time(self) -> float:
+        """Game time in seconds."""
+        return self.tick / self.fps
+
+    def advance(self) -> None:
+        self.tick += 1
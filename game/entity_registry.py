@@ -0,0 +1,211 @@
+from itertools import chain
+
+import numpy as np
+
+
+class StaticEntities:
+    """
+    The static entities of a map (its obstacles), with ids `0, 1, ...` in
+    map order, by type and as arrays of their boxes.
+
+    Statics never change once the game runs, so one `StaticEntities` is
+    built per map and shared by every registry and store playing on it,
+    including those of resets and forks. Nothing may add to or change it
+    afterwards.
+    """
+
+    def __init__(self, entities=()):
+        self.entities: tuple = tuple(entities)
+        self.by_id: dict[int, object] = {}
+        self.buckets: dict[type, list] = {}
+        for entity_id, entity in enumerate(self.entities):
+            entity.entity_id = entity_id
+            self.by_id[entity_id] = entity
+            self.buckets.setdefault(type(entity), []).append(entity)
+
+        self.x = np.array([e.x for e in self.entities], dtype=float)
+        self.y = np.array([e.y for e in self.entities], dtype=float)
+        self.half_width = np.array([e.size[0] / 2 for e in self.entities], dtype=float)
+        self.half_height = np.array([e.size[1] / 2 for e in self.entities], dtype=float)
+        self.occupied_mask = np.array([e.occupied_mask for e in self.entities], dtype=np.int64)
+        for array in (self.x, self.y, self.half_width, self.half_height, self.occupied_mask):
+            array.flags.writeable = False
+        self._sorted: dict[int, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def sorted_by_x(self, layer: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The statics occupying `layer`, ordered by x, and their x values.
+        """
+        found = self._sorted.get(layer)
+        if found is None:
+            targets = np.flatnonzero(self.occupied_mask & layer)
+            order = targets[np.argsort(self.x[targets], kind="stable")]
+            found = self._sorted[layer] = (order, self.x[order])
+        return found
+
+
+class EntityList:
+    """
+    The shared statics followed by the dynamic entities of a registry, as
+    one read-only sequence.
+    """
+
+    def __init__(self, statics: tuple, dynamic: list):
+        self.statics = statics
+        self.dynamic = dynamic
+
+    def __len__(self) -> int:
+        return len(self.statics) + len(self.dynamic)
+
+    def __iter__(self):
+        return chain(self.statics, self.dynamic)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        static_count = len(self.statics)
+        if index < 0:
+            index += len(self)
+        if index < static_count:
+            return self.statics[index]
+        return self.dynamic[index - static_count]
+
+
+class EntityRegistry:
+    """
+    The live entities of a simulation.
+
+    Every entity gets a stable `entity_id` when added and is listed both in
+    `entities` and in the bucket of its type. Static entities (the map) come
+    from a `StaticEntities` shared with other registries on the same map;
+    they come first in `entities` and are never updated, culled or removed,
+    so the lifecycle passes only walk the dynamic ones. Removing an entity
+    moves the last one into its position, so the cost depends on how many
+    are removed, not on how many are alive. With a `store` the dynamic
+    entities live in its arrays, in its slot order.
+    """
+
+    def __init__(self, store=None, statics: StaticEntities | None = None):
+        self.store = store
+        self.statics = statics if statics is not None else StaticEntities()
+        self._dynamic: list = store.entities if store is not None else []
+        self.entities = EntityList(self.statics.entities, self._dynamic)
+        self.static_count = len(self.statics)
+        # Buckets of dynamic types; static ones are in `statics`
+        self.buckets: dict[type, list] = {}
+        self._by_id: dict[int, object] = {}
+        self.next_id = self.static_count
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def get(self, entity_id: int):
+        entity = self._by_id.get(entity_id)
+        return entity if entity is not None else self.statics.by_id.get(entity_id)
+
+    def bucket(self, cls: type) -> list:
+        """
+        The live entities of exactly type `cls`. The list is kept up to date,
+        so it can be held on to. Buckets of static types must not be changed.
+        """
+        if cls.is_static:
+            return self.statics.buckets.get(cls, [])
+        bucket = self.buckets.get(cls)
+        if bucket is None:
+            bucket = self.buckets[cls] = []
+        return bucket
+
+    def dynamic(self):
+        return iter(self._dynamic)
+
+    def index(self, entity) -> int:
+        """
+        The position of a dynamic entity among the dynamic ones.
+        """
+        return entity._slot if self.store is not None else entity._index
+
+    def add(self, entity, entity_id: int | None = None) -> int:
+        """
+        Adds the dynamic `entity` under the next free id, or under
+        `entity_id` when restoring a snapshot, and returns the id.
+        """
+        if entity.is_static:
+            raise ValueError("static entities are given to the registry as StaticEntities")
+        if entity_id is None:
+            entity_id = self.next_id
+            self.next_id += 1
+        entity.entity_id = entity_id
+        self._by_id[entity_id] = entity
+        bucket = entity._bucket = self.bucket(type(entity))
+        entity._bucket_index = len(bucket)
+        bucket.append(entity)
+
+        if self.store is not None:
+            self.store.add(entity)
+        else:
+            entity._index = len(self._dynamic)
+            self._dynamic.append(entity)
+        return entity_id
+
+    def clear_dynamic(self) -> None:
+        """
+        Removes every dynamic entity. Buckets are emptied in place, so lists
+        returned by `bucket` stay valid.
+        """
+        for entity in self._dynamic:
+            del entity._bucket, entity._bucket_index
+            if self.store is None:
+                del entity._index
+        self._by_id.clear()
+        for bucket in self.buckets.values():
+            bucket.clear()
+        if self.store is not None:
+            self.store.clear()
+        else:
+            self._dynamic.clear()
+
+    def queued(self) -> list:
+        """
+        Culls dynamic entities that left the map and returns every dynamic
+        entity queued for deletion, in list order.
+        """
+        entities = self._dynamic
+        store = self.store
+        if store is not None:
+            store.delete_if_too_far()
+            slots = np.flatnonzero(store.queued_for_deletion[: store.count])
+            return [entities[slot] for slot in slots.tolist()]
+
+        queued = []
+        for entity in self.dynamic():
+            entity.delete_if_too_far()
+            if entity.queued_for_deletion:
+                queued.append(entity)
+        return queued
+
+    def remove(self, removed: list) -> None:
+        for entity in removed:
+            del self._by_id[entity.entity_id]
+            bucket = entity._bucket
+            last = bucket.pop()
+            if last is not entity:
+                bucket[entity._bucket_index] = last
+                last._bucket_index = entity._bucket_index
+            del entity._bucket, entity._bucket_index
+
+        # Highest positions first, so the entity moved into a freed
+        # position is never one that is being removed as well
+        positions = sorted((self.index(entity) for entity in removed), reverse=True)
+        if self.store is not None:
+            self.store.swap_remove(positions)
+            return
+        entities = self._dynamic
+        for position in positions:
+            del entities[position]._index
+            last = entities.pop()
+            if position < len(entities):
+                entities[position] = last
+                last._index = position
@@ -0,0 +1,330 @@
+import numpy as np
+
+import characters.entity as ent
+from config import DEFAULT_SETTINGS, GameSettings
+from game.entity_registry import StaticEntities
+
+
+class EntityStore:
+    """
+    Structure-of-arrays storage for an array-backed simulation.
+
+    Every added dynamic entity owns one slot in a set of contiguous NumPy
+    arrays and its class is swapped for a view subclass whose attributes
+    read and write those arrays. Slots are kept in the same order as
+    `entities`, so batched code and the per-entity Python code see the world
+    in the same order. The map's static entities are not stored but read
+    from the shared `statics`, so stores on one map never copy them.
+    """
+
+    # Attributes moved from the entity into the arrays while it is stored.
+    view_fields: dict[str, type] = {
+        "x": float,
+        "y": float,
+        "velocity_y": float,
+        "health": float,
+        "is_falling": bool,
+        "queued_for_deletion": bool,
+    }
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        settings: GameSettings = DEFAULT_SETTINGS,
+        statics: StaticEntities | None = None,
+    ):
+        self.settings = settings
+        self.statics = statics if statics is not None else StaticEntities()
+        self.capacity = capacity
+        self.count = 0
+        self.entities: list = []
+        self._kinds: list[type] = []
+        self._kind_codes: dict[type, int] = {}
+
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.velocity_y = np.zeros(capacity)
+        self.health = np.zeros(capacity)
+        self.is_falling = np.zeros(capacity, dtype=bool)
+        self.queued_for_deletion = np.zeros(capacity, dtype=bool)
+        self.step_x = np.zeros(capacity)
+        self.step_y = np.zeros(capacity)
+        self.half_width = np.zeros(capacity)
+        self.half_height = np.zeros(capacity)
+        self.occupied_mask = np.zeros(capacity, dtype=np.int64)
+        self.reacts_to_mask = np.zeros(capacity, dtype=np.int64)
+        self.kind = np.zeros(capacity, dtype=np.int16)
+        self.entity_id = np.full(capacity, -1, dtype=np.int64)
+
+    _array_names = (
+        "x",
+        "y",
+        "velocity_y",
+        "health",
+        "is_falling",
+        "queued_for_deletion",
+        "step_x",
+        "step_y",
+        "half_width",
+        "half_height",
+        "occupied_mask",
+        "reacts_to_mask",
+        "kind",
+        "entity_id",
+    )
+
+    def _grow(self) -> None:
+        self.capacity *= 2
+        for name in self._array_names:
+            old = getattr(self, name)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[: self.count] = old[: self.count]
+            setattr(self, name, new)
+
+    @property
+    def kinds(self) -> tuple[type, ...]:
+        """
+        The classes of the stored entities, indexed by the codes in `kind`.
+        """
+        return tuple(self._kinds)
+
+    def _kind_code(self, cls: type) -> int:
+        code = self._kind_codes.get(cls)
+        if code is None:
+            code = self._kind_codes[cls] = len(self._kinds)
+            self._kinds.append(cls)
+        return code
+
+    def add(self, entity) -> int:
+        if entity.is_static:
+            raise ValueError("static entities are read from the store's statics")
+        if "_store" in entity.__dict__:
+            raise ValueError(f"{entity!r} is already in an EntityStore")
+        if self.count == self.capacity:
+            self._grow()
+        slot = self.count
+        self.count += 1
+        self.entities.append(entity)
+
+        values = entity.__dict__
+        for name in self.view_fields:
+            getattr(self, name)[slot] = values.pop(name)
+        self.step_x[slot] = getattr(entity, "step_x", 0.0)
+        self.step_y[slot] = getattr(entity, "step_y", 0.0)
+        self.half_width[slot] = entity.size[0] / 2
+        self.half_height[slot] = entity.size[1] / 2
+        self.occupied_mask[slot] = entity.occupied_mask
+        self.reacts_to_mask[slot] = entity.reacts_to_mask
+        self.kind[slot] = self._kind_code(type(entity))
+        self.entity_id[slot] = getattr(entity, "entity_id", -1)
+
+        entity._store = self
+        entity._slot = slot
+        entity.__class__ = _view_class(type(entity))
+        return slot
+
+    def _unbind(self, entity) -> None:
+        slot = entity._slot
+        values = {name: cast(getattr(self, name)[slot]) for name, cast in self.view_fields.items()}
+        entity.__class__ = entity._stored_class
+        del entity._store, entity._slot
+        entity.__dict__.update(values)
+
+    def swap_remove(self, slots: list[int]) -> None:
+        """
+        Removes the entities in `slots`, given in descending order, moving
+        the last entity into each freed slot.
+        """
+        entities = self.entities
+        for slot in slots:
+            self._unbind(entities[slot])
+            last = self.count - 1
+            if slot != last:
+                for name in self._array_names:
+                    array = getattr(self, name)
+                    array[slot] = array[last]
+                moved = entities[slot] = entities[last]
+                moved._slot = slot
+            entities.pop()
+            self.count = last
+
+    def clear(self) -> None:
+        """
+        Removes every entity.
+        """
+        self.truncate(0)
+
+    def truncate(self, count: int) -> None:
+        """
+        Removes every entity from slot `count` on.
+        """
+        entities = self.entities
+        for entity in entities[count:]:
+            self._unbind(entity)
+        del entities[count:]
+        self.count = min(self.count, count)
+
+    def update(self, profiler=None) -> None:
+        """
+        Runs one batched update per entity type. Types are updated in the
+        order they were first added. Random draws made while updating
+        therefore happen in type order rather than list order. With a
+        `profiler` every type's update is timed.
+        """
+        kinds = self.kind[: self.count]
+        for code, cls in enumerate(self._kinds):
+            if cls.update is ent.Entity.update:
+                continue
+            slots = np.flatnonzero(kinds == code)
+            if len(slots):
+                if profiler is not None:
+                    profiler.start(cls.__name__)
+                cls.batch_update(self, slots)
+                if profiler is not None:
+                    profiler.stop()
+
+    def delete_if_too_far(self) -> None:
+        settings = self.settings
+        count = self.count
+        x = self.x[:count]
+        y = self.y[:count]
+        self.queued_for_deletion[:count] |= (
+            (x < settings.despawn_min_x)
+            | (y < settings.despawn_min_y)
+            | (x > settings.despawn_max_x)
+            | (y > settings.despawn_max_y)
+        )
+
+    def overlapping_pairs(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns pairs `(first, second)` whose boxes overlap and where `first`
+        reacts to a layer `second` occupies, in the order the per-entity
+        collision loop would visit them. Pairs are numbered like a registry's
+        `entities`: statics first, then slot `s` as `len(statics) + s`.
+        """
+        count = self.count
+        statics = self.statics
+        static_count = len(statics)
+        reacts = self.reacts_to_mask[:count]
+        occupied = self.occupied_mask[:count]
+        active = reacts != 0
+        firsts = []
+        seconds = []
+        mask = int(np.bitwise_or.reduce(reacts[active])) if active.any() else 0
+        while mask:
+            layer = mask & -mask
+            mask ^= layer
+            sources = np.flatnonzero(active & ((reacts & layer) != 0))
+            if not len(sources):
+                continue
+            targets = np.flatnonzero((occupied & layer) != 0)
+            if len(targets):
+                first, second = self._overlaps(sources, self, targets)
+                firsts.append(first + static_count)
+                seconds.append(second + static_count)
+            order, sorted_x = statics.sorted_by_x(layer)
+            if len(order):
+                first, second = self._overlaps(sources, statics, order, sorted_x)
+                firsts.append(first + static_count)
+                seconds.append(second)
+        if not firsts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+
+        total = static_count + count
+        first = np.concatenate(firsts)
+        second = np.concatenate(seconds)
+        distinct = first != second
+        pair_ids = np.unique(first[distinct] * total + second[distinct])
+        return pair_ids // total, pair_ids % total
+
+    # When either side of a layer test has at most this many entities the
+    # pairs are found with a full broadcast, otherwise with a sweep along x.
+    broadcast_limit = 64
+
+    def _overlaps(
+        self, sources: np.ndarray, other, targets: np.ndarray, sorted_x: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Pairs of source slots and `targets` in `other`, this store or the
+        # statics; `sorted_x` is given when `targets` are already sorted by x
+        x, y = self.x, self.y
+        half_width, half_height = self.half_width, self.half_height
+        other_x, other_y = other.x, other.y
+        other_width, other_height = other.half_width, other.half_height
+        if min(len(sources), len(targets)) <= self.broadcast_limit:
+            hit = (
+                np.abs(x[sources][:, None] - other_x[targets])
+                <= half_width[sources][:, None] + other_width[targets]
+            ) & (
+                np.abs(y[sources][:, None] - other_y[targets])
+                <= half_height[sources][:, None] + other_height[targets]
+            )
+            source_index, target_index = np.nonzero(hit)
+            return sources[source_index], targets[target_index]
+
+        if sorted_x is None:
+            targets = targets[np.argsort(other_x[targets], kind="stable")]
+            sorted_x = other_x[targets]
+        reach = half_width[sources] + other_width[targets].max()
+        start = np.searchsorted(sorted_x, x[sources] - reach, side="left")
+        stop = np.searchsorted(sorted_x, x[sources] + reach, side="right")
+        lengths = stop - start
+        first = np.repeat(sources, lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        second = targets[np.repeat(start, lengths) + offsets]
+        hit = (
+            np.abs(x[first] - other_x[second]) <= half_width[first] + other_width[second]
+        ) & (
+            np.abs(y[first] - other_y[second]) <= half_height[first] + other_height[second]
+        )
+        return first[hit], second[hit]
+
+    def resolve_collisions(self) -> int:
+        """
+        Evaluates the overlapping pairs found at the start of the pass. Each
+        pair is re-checked against current positions first, since earlier
+        responses may have moved one of the entities. Returns the number of
+        pairs evaluated.
+        """
+        statics = self.statics.entities
+        static_count = len(statics)
+        entities = self.entities
+        pairs = 0
+        first, second = self.overlapping_pairs()
+        for index1, index2 in zip(first.tolist(), second.tolist()):
+            entity1 = entities[index1 - static_count]
+            entity2 = (
+                statics[index2] if index2 < static_count else entities[index2 - static_count]
+            )
+            if entity1.check_collision(entity2):
+                pairs += 1
+                entity1.evaluate_collision(entity2)
+        return pairs
+
+
+def _stored_property(name: str, cast: type) -> property:
+    def fget(self):
+        return cast(getattr(self._store, name)[self._slot])
+
+    def fset(self, value):
+        getattr(self._store, name)[self._slot] = value
+
+    return property(fget, fset)
+
+
+_view_classes: dict[type, type] = {}
+
+
+def _view_class(cls: type) -> type:
+    view = _view_classes.get(cls)
+    if view is None:
+        namespace = {
+            name: _stored_property(name, cast)
+            for name, cast in EntityStore.view_fields.items()
+        }
+        namespace["_stored_class"] = cls
+        namespace["__module__"] = cls.__module__
+        namespace["__qualname__"] = cls.__qualname__
+        view = _view_classes[cls] = type(cls.__name__, (cls,), namespace)
+    return view
+
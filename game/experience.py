@@ -0,0 +1,207 @@
+import os
+
+import numpy as np
+
+from game.simulation import Simulation
+
+
+class ExperienceBuffer:
+    """
+    Ring buffer of `(observation, action, reward, next_observation, done)`
+    transitions in preallocated arrays.
+
+    Once `capacity` transitions are stored the oldest are overwritten, so
+    the memory used is fixed up front, see `nbytes`. With a `path` the
+    arrays are memory-mapped `.npy` files in that directory, which lets the
+    buffer outgrow RAM and survive the process; opening the same path again
+    with the same sizes, dtype and `alpha` carries on where it stopped. Batches are gathered by index, so sampling
+    never copies more than the batch.
+
+    `sample` draws uniformly. `sample_prioritized` draws transitions in
+    proportion to their priority to the power `alpha`, using a sum tree
+    kept next to the arrays. New transitions get the highest priority seen
+    so far, and `update_priorities` sets them, e.g. to TD errors.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        observation_size: int = Simulation.observation_size,
+        action_size: int = Simulation.action_size,
+        path: str | os.PathLike | None = None,
+        alpha: float = 0.6,
+        dtype=np.float32,
+    ):
+        self.capacity = capacity
+        self.alpha = alpha
+        self.path = path
+        # Leaves of the sum tree, a power of two so every level is full
+        self.leaves = 1 << max(capacity - 1, 1).bit_length()
+        shapes = {
+            "observations": ((capacity, observation_size), dtype),
+            "actions": ((capacity, action_size), dtype),
+            "rewards": ((capacity,), dtype),
+            "next_observations": ((capacity, observation_size), dtype),
+            "dones": ((capacity,), np.bool_),
+            "priority_tree": ((2 * self.leaves,), np.float64),
+            # Next position to write, transitions stored, largest priority,
+            # and the alpha the priorities were raised to
+            "counters": ((4,), np.float64),
+        }
+        reopened = path is not None and os.path.exists(os.path.join(path, "counters.npy"))
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+        self.arrays = {name: self._allocate(name, shape, dtype) for name, (shape, dtype) in shapes.items()}
+        self.observations = self.arrays["observations"]
+        self.actions = self.arrays["actions"]
+        self.rewards = self.arrays["rewards"]
+        self.next_observations = self.arrays["next_observations"]
+        self.dones = self.arrays["dones"]
+        self._tree = self.arrays["priority_tree"]
+        self._counters = self.arrays["counters"]
+        if not reopened:
+            self._counters[2] = 1.0
+            self._counters[3] = alpha
+        elif self._counters[3] != alpha:
+            # The sum tree holds priorities to the power of the old alpha
+            raise ValueError(f"{path} was filled with alpha {self._counters[3]}, not {alpha}")
+
+    def _allocate(self, name: str, shape: tuple, dtype) -> np.ndarray:
+        if self.path is None:
+            return np.zeros(shape, dtype=dtype)
+        file = os.path.join(self.path, f"{name}.npy")
+        if os.path.exists(file):
+            array = np.lib.format.open_memmap(file, mode="r+")
+            if array.shape != shape or array.dtype != np.dtype(dtype):
+                raise ValueError(
+                    f"{file} holds {array.dtype} {array.shape}, expected {np.dtype(dtype)} {shape}"
+                )
+            return array
+        return np.lib.format.open_memmap(file, mode="w+", dtype=dtype, shape=shape)
+
+    @property
+    def position(self) -> int:
+        return int(self._counters[0])
+
+    def __len__(self) -> int:
+        return int(self._counters[1])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def add(self, observations, actions, rewards, next_observations, dones) -> np.ndarray:
+        """
+        Appends a batch of transitions, one per row, and returns the indices
+        they were written to.
+        """
+        rewards = np.atleast_1d(rewards)
+        count = len(rewards)
+        indices = (self.position + np.arange(count)) % self.capacity
+        # Only the last `capacity` rows of an oversized batch survive
+        rows = slice(max(count - self.capacity, 0), count)
+        indices = indices[rows]
+        self.observations[indices] = np.asarray(observations).reshape(count, -1)[rows]
+        self.actions[indices] = np.asarray(actions).reshape(count, -1)[rows]
+        self.rewards[indices] = rewards[rows]
+        self.next_observations[indices] = np.asarray(next_observations).reshape(count, -1)[rows]
+        self.dones[indices] = np.atleast_1d(dones)[rows]
+        self._set_priorities(indices, np.full(len(indices), self._counters[2]))
+        self._counters[0] = (self.position + count) % self.capacity
+        self._counters[1] = min(len(self) + count, self.capacity)
+        return indices
+
+    def _batch(self, indices: np.ndarray) -> dict[str, np.ndarray]:
+        return {
+            "observations": self.observations[indices],
+            "actions": self.actions[indices],
+            "rewards": self.rewards[indices],
+            "next_observations": self.next_observations[indices],
+            "dones": self.dones[indices],
+            "indices": indices,
+        }
+
+    def sample(self, batch_size: int, rng: np.random.Generator) -> dict[str, np.ndarray]:
+        """
+        Draws `batch_size` transitions uniformly with replacement.
+        """
+        if not len(self):
+            raise ValueError("cannot sample from an empty buffer")
+        return self._batch(rng.integers(0, len(self), batch_size))
+
+    def sample_prioritized(
+        self, batch_size: int, rng: np.random.Generator, beta: float = 0.4
+    ) -> tuple[dict[str, np.ndarray], np.ndarray]:
+        """
+        Draws `batch_size` transitions in proportion to their priority, one
+        from each of `batch_size` equal slices of the total, and returns them
+        with importance-sampling weights scaled to at most 1.
+        """
+        if not len(self):
+            raise ValueError("cannot sample from an empty buffer")
+        tree = self._tree
+        total = tree[1]
+        targets = (np.arange(batch_size) + rng.random(batch_size)) * (total / batch_size)
+        # Rounding can overshoot the last leaf with a priority
+        targets = np.minimum(targets, np.nextafter(total, 0))
+        nodes = np.ones(batch_size, dtype=np.int64)
+        while nodes[0] < self.leaves:
+            left = tree[2 * nodes]
+            right = targets >= left
+            targets -= left * right
+            nodes = 2 * nodes + right
+        indices = np.minimum(nodes - self.leaves, len(self) - 1)
+
+        probabilities = tree[self.leaves + indices] / total
+        weights = (len(self) * probabilities) ** -beta
+        weights /= weights.max()
+        return self._batch(indices), weights
+
+    def update_priorities(self, indices, priorities) -> None:
+        """
+        Sets the priorities of the transitions at `indices`, e.g. to the
+        absolute TD errors of a sampled batch.
+        """
+        priorities = np.abs(np.asarray(priorities, dtype=np.float64)) + 1e-6
+        self._counters[2] = max(self._counters[2], priorities.max())
+        self._set_priorities(np.asarray(indices), priorities)
+
+    def _set_priorities(self, indices: np.ndarray, priorities: np.ndarray) -> None:
+        if not len(indices):
+            return
+        tree = self._tree
+        nodes = indices + self.leaves
+        tree[nodes] = priorities**self.alpha
+        # Sums are redone level by level for the parents of changed nodes
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            tree[nodes] = tree[2 * nodes] + tree[2 * nodes + 1]
+
+    def flush(self) -> None:
+        """
+        Writes memory-mapped arrays to disk.
+        """
+        for array in self.arrays.values():
+            if isinstance(array, np.memmap):
+                array.flush()
+
+
+def record_transitions(
+    buffer: ExperienceBuffer,
+    previous: np.ndarray,
+    actions,
+    rewards: np.ndarray,
+    observations: np.ndarray,
+    dones: np.ndarray,
+    infos: list[dict],
+    next_observations: np.ndarray,
+) -> None:
+    """
+    Adds one step of a batch runner to `buffer`. Finished episodes were
+    already reset, so their next observation is the terminal one kept in
+    `info`; `next_observations` is scratch space for patching those in.
+    """
+    np.copyto(next_observations, observations)
+    for index in np.flatnonzero(dones).tolist():
+        next_observations[index] = infos[index]["terminal_observation"]
+    buffer.add(previous, actions, rewards, next_observations, dones)
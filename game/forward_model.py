@@ -0,0 +1,282 @@
+import numpy as np
+
+import characters.entity as ent
+from config import BulletConfig, PlannerConfig
+
+
+def first_overlap_ticks(x, y, step_x, step_y, left, top, right, bottom, first: int = 1) -> np.ndarray:
+    """
+    For points starting at `(x, y)` and moving `(step_x, step_y)` per tick,
+    the first tick from `first` on at which each point is inside each box,
+    as an `(points, boxes)` array with `inf` where it never is. Boxes are
+    closed, like the overlap test of `Entity.check_collision`.
+    """
+    x, y, step_x, step_y = (np.asarray(a, dtype=float)[:, None] for a in (x, y, step_x, step_y))
+    enter_x, exit_x = _slab(x, step_x, np.asarray(left, dtype=float), np.asarray(right, dtype=float))
+    enter_y, exit_y = _slab(y, step_y, np.asarray(top, dtype=float), np.asarray(bottom, dtype=float))
+    enter = np.ceil(np.maximum(np.maximum(enter_x, enter_y), first))
+    exit = np.minimum(exit_x, exit_y)
+    return np.where(enter <= exit, enter, np.inf)
+
+
+def _slab(position, step, low, high) -> tuple[np.ndarray, np.ndarray]:
+    # The time interval during which `low <= position + step * t <= high`
+    with np.errstate(divide="ignore", invalid="ignore"):
+        to_low = (low - position) / step
+        to_high = (high - position) / step
+    inside = (low <= position) & (position <= high)
+    still = step == 0
+    enter = np.where(still, np.where(inside, -np.inf, np.inf), np.minimum(to_low, to_high))
+    exit = np.where(still, np.where(inside, np.inf, -np.inf), np.maximum(to_low, to_high))
+    return enter, exit
+
+
+_hurt_masks: dict[type, int] = {}
+
+
+def _hurt_mask(entity) -> int:
+    # The layers whose collisions hurt entities of this type
+    mask = _hurt_masks.get(type(entity))
+    if mask is None:
+        mask = 0
+        for layer, response in entity.collision_interactions.items():
+            if ent.CollisionInteractions.HURT in response:
+                mask |= layer.value
+        _hurt_masks[type(entity)] = mask
+    return mask
+
+
+class ForwardModel:
+    """
+    Cheap batched rollouts of candidate actions for a group of agents.
+
+    `load` takes what the rollouts need from a simulation and `begin`
+    starts one rollout per agent and candidate. Each `advance` moves every
+    rollout one tick forward: agents walk, jump, fall and land on platforms
+    like a `Player`, bullets fly straight until they hit a platform, and
+    the target stands still. `scores` is up to date after every tick, so a
+    planner can stop at any depth. All rollouts advance in the same NumPy
+    operations, so the cost of a tick barely depends on how many there are.
+    """
+
+    def __init__(self, config: PlannerConfig = PlannerConfig()):
+        self.config = config
+        self.bullet_radius = BulletConfig().radius
+        self.bullet_damage = BulletConfig().damage
+        self.depth = 0
+
+    def load(self, simulation) -> None:
+        """
+        Takes the map, bullets and target from `simulation`. Bullets are read
+        from its observation builder, so it has to have gathered this tick.
+        """
+        self.settings = simulation.settings
+        self.map = simulation.map
+        self.bullets = simulation.observation_builder.bullets
+        self.target = simulation.player
+
+    def begin(self, agents: list, moves, jumps, shots) -> None:
+        """
+        Starts rolling out every candidate for every agent: `moves` of -1, 0
+        or 1 each tick, and a jump and a shot at the target on the first tick
+        where `jumps` and `shots` are set. Row `a * len(moves) + c` is
+        candidate `c` of agent `a`.
+        """
+        settings = self.settings
+        horizon = self.config.horizon
+        self.depth = 0
+        candidates = len(moves)
+        count = len(agents) * candidates
+
+        def per_row(values) -> np.ndarray:
+            return np.repeat(np.asarray(values, dtype=float), candidates)
+
+        self.x = per_row([agent.x for agent in agents])
+        self.y = per_row([agent.y for agent in agents])
+        self.velocity_y = per_row([agent.velocity_y for agent in agents])
+        self.is_falling = per_row([agent.is_falling for agent in agents]).astype(bool)
+        self.health = per_row([agent.health for agent in agents])
+        half_width = per_row([agent.size[0] / 2 for agent in agents])
+        half_height = per_row([agent.size[1] / 2 for agent in agents])
+        self.move_steps = np.tile(np.asarray(moves, dtype=float), len(agents)) * settings.player_speed
+        self.jumps = np.tile(np.asarray(jumps, dtype=bool), len(agents))
+        self.min_x = half_width
+        self.max_x = settings.map_width - half_width
+        self.damage = np.zeros(count)
+        self.alive = np.ones(count, dtype=bool)
+        self.rewards = np.zeros(count)
+
+        # Where each agent could get to within the horizon
+        reach_x = settings.player_speed * horizon
+        rise = settings.player_jump_velocity**2 / (2 * settings.gravity)
+        drop = abs(settings.player_jump_velocity) * horizon + settings.gravity * horizon**2 / 2
+        agent_x = self.x[::candidates]
+        agent_y = self.y[::candidates]
+        agent_half_width = half_width[::candidates]
+        agent_half_height = half_height[::candidates]
+        regions = np.column_stack(
+            (
+                agent_x - reach_x - agent_half_width,
+                agent_y - rise - agent_half_height,
+                agent_x + reach_x + agent_half_width,
+                agent_y + drop + agent_half_height,
+            )
+        )
+
+        # Bullets that hurt an agent and can get near it in time
+        bullets = self.bullets
+        radius = self.bullet_radius
+        end_x = bullets[:, 0] + bullets[:, 2] * horizon
+        end_y = bullets[:, 1] + bullets[:, 3] * horizon
+        hurt_masks = np.array([_hurt_mask(agent) for agent in agents], dtype=np.int64)
+        near = (
+            ((bullets[:, 4].astype(np.int64) & hurt_masks[:, None]) != 0)
+            & (np.minimum(bullets[:, 0], end_x) <= regions[:, 2:3])
+            & (np.maximum(bullets[:, 0], end_x) >= regions[:, 0:1])
+            & (np.minimum(bullets[:, 1], end_y) <= regions[:, 3:4])
+            & (np.maximum(bullets[:, 1], end_y) >= regions[:, 1:2])
+        )
+        kept = near.any(axis=0)
+        bullets = bullets[kept]
+
+        # A shot flies from where the agent is after its first move
+        target = self.target
+        start_x = self._moved_x(self.x)
+        start_y = self.y
+        self.aims = np.arctan2(target.y - start_y, target.x - start_x)
+        shot_step_x = np.cos(self.aims) * settings.bullet_speed
+        shot_step_y = np.sin(self.aims) * settings.bullet_speed
+
+        # Platforms anything rolled out can touch
+        index = self.map.index
+        found = [index.overlapping(*region) for region in regions.tolist()]
+        paths_x = np.concatenate((bullets[:, 0], end_x[kept], start_x, start_x + shot_step_x * horizon))
+        paths_y = np.concatenate((bullets[:, 1], end_y[kept], start_y, start_y + shot_step_y * horizon))
+        found.append(
+            index.overlapping(
+                paths_x.min() - radius,
+                paths_y.min() - radius,
+                paths_x.max() + radius,
+                paths_y.max() + radius,
+            )
+        )
+        boxes = self.map.boxes[np.unique(np.concatenate(found))]
+        left, top = boxes[:, 0], boxes[:, 1]
+        right, bottom = left + boxes[:, 2], top + boxes[:, 3]
+        self.platforms = (left, top, right, bottom)
+        # An agent touches a platform while its centre is inside the box
+        # grown by half the agent's size
+        self.touch_left = left - half_width[:, None]
+        self.touch_right = right + half_width[:, None]
+        self.touch_top = top - half_height[:, None]
+        self.touch_bottom = bottom + half_height[:, None]
+
+        self.bullet_x, self.bullet_y = bullets[:, 0], bullets[:, 1]
+        self.bullet_step_x, self.bullet_step_y = bullets[:, 2], bullets[:, 3]
+        self.bullet_expiry = self._expiry(bullets[:, 0], bullets[:, 1], bullets[:, 2], bullets[:, 3])
+        self.reach_x = (half_width + radius)[:, None]
+        self.reach_y = (half_height + radius)[:, None]
+        # Bullets that cannot hurt an agent count as spent in its rows
+        self.bullet_spent = ~np.repeat(near[:, kept], candidates, axis=0)
+
+        # The target is tested as one more box after the platforms
+        target_x = target.size[0] / 2 + radius
+        target_y = target.size[1] / 2 + radius
+        ticks = first_overlap_ticks(
+            start_x,
+            start_y,
+            shot_step_x,
+            shot_step_y,
+            np.append(left - radius, target.x - target_x),
+            np.append(top - radius, target.y - target_y),
+            np.append(right + radius, target.x + target_x),
+            np.append(bottom + radius, target.y + target_y),
+        )
+        hit_tick = ticks[:, -1]
+        blocked = hit_tick > ticks[:, :-1].min(axis=1, initial=np.inf)
+        useful = np.tile(np.asarray(shots, dtype=bool), len(agents)) & ~blocked & (target.health > 0)
+        self.shot_hit_tick = np.where(useful, hit_tick, np.inf)
+        self._shot_ticks = set(self.shot_hit_tick[useful].tolist())
+
+    def _expiry(self, x, y, step_x, step_y) -> np.ndarray:
+        # The tick at which each bullet hits a platform
+        left, top, right, bottom = self.platforms
+        if not len(left) or not len(x):
+            return np.full(len(x), np.inf)
+        radius = self.bullet_radius
+        ticks = first_overlap_ticks(
+            x, y, step_x, step_y, left - radius, top - radius, right + radius, bottom + radius
+        )
+        return ticks.min(axis=1)
+
+    def _moved_x(self, x: np.ndarray) -> np.ndarray:
+        moved = x + self.move_steps
+        return np.where((self.min_x <= moved) & (moved <= self.max_x), moved, x)
+
+    def advance(self) -> None:
+        """
+        Rolls every candidate one tick further.
+        """
+        settings = self.settings
+        config = self.config
+        self.depth = tick = self.depth + 1
+        alive = self.alive
+
+        # Acting, as in `Player.apply_action`
+        self.x = x = self._moved_x(self.x)
+        if tick == 1:
+            jumping = self.jumps & ~self.is_falling
+            self.velocity_y = np.where(jumping, settings.player_jump_velocity, self.velocity_y)
+            self.is_falling = self.is_falling | jumping
+
+        # Updating, as in `Player.update`
+        y = self.y + self.velocity_y * self.is_falling
+        velocity_y = self.velocity_y + settings.gravity * self.is_falling
+
+        # Landing, as in `Entity.evaluate_collision` with STAND
+        columns_x, columns_y = x[:, None], y[:, None]
+        touching = (
+            (columns_x >= self.touch_left)
+            & (columns_x <= self.touch_right)
+            & (columns_y >= self.touch_top)
+            & (columns_y <= self.touch_bottom)
+            & ((y - velocity_y)[:, None] <= self.touch_top)
+        )
+        tops = np.where(touching, self.touch_top, np.inf).min(axis=1, initial=np.inf)
+        landed = tops < np.inf
+        self.y = y = np.where(landed, tops, y)
+        velocity_y[landed] = 0.0
+        self.velocity_y = velocity_y
+        self.is_falling = ~landed
+
+        # Bullets hit once, while they have not hit a platform yet
+        if len(self.bullet_x):
+            bullet_x = self.bullet_x + self.bullet_step_x * tick
+            bullet_y = self.bullet_y + self.bullet_step_y * tick
+            hits = (
+                (np.abs(columns_x - bullet_x) <= self.reach_x)
+                & (np.abs(y[:, None] - bullet_y) <= self.reach_y)
+                & (tick <= self.bullet_expiry)
+                & ~self.bullet_spent
+            )
+            self.bullet_spent |= hits
+            damage = hits.sum(axis=1) * self.bullet_damage
+            self.damage += damage
+            self.rewards -= config.damage_penalty * damage * alive
+        if tick in self._shot_ticks:
+            self.rewards += config.hit_reward * (self.shot_hit_tick == tick)
+
+        died = alive & ((self.damage >= self.health) | (y > settings.despawn_max_y))
+        if died.any():
+            self.rewards -= config.death_penalty * died
+            self.alive = alive & ~died
+
+    @property
+    def scores(self) -> np.ndarray:
+        """
+        The rewards so far plus how well placed each candidate is now.
+        """
+        target = self.target
+        distance = np.hypot(self.x - target.x, self.y - target.y)
+        away = np.abs(distance - self.config.preferred_distance)
+        return self.rewards - self.config.distance_penalty * away * self.alive
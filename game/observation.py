@@ -0,0 +1,269 @@
+import numpy as np
+
+import characters.entity as ent
+from characters.bullet import Bullet
+from config import DEFAULT_SETTINGS, GameSettings, ObservationConfig
+
+
+class ObservationBuilder:
+    """
+    Writes fixed-shape observations of the game as seen by one agent.
+
+    The observation is, in order:
+        self: x, y, velocity_y, health, is_falling
+        nearest opponents: dx, dy, health, present
+        nearest bullets: dx, dy, step_x, step_y, hostile, present
+        nearest platforms: dx, dy, width, height, present
+    Positions are relative to the agent and scaled by the map size; missing
+    entries are zero. `gather` collects the world state once per tick, after
+    which `observe`, or `observe_batch` for many at once, can be called for
+    any number of agents. The state is written into arrays kept on the
+    builder, which only grow when the game does, so `players`, `bots` and
+    `bullets` are overwritten by the next `gather`.
+    """
+
+    self_size = 5
+    opponent_size = 4
+    bullet_size = 6
+    platform_size = 5
+
+    def __init__(
+        self,
+        config: ObservationConfig = ObservationConfig(),
+        settings: GameSettings = DEFAULT_SETTINGS,
+    ):
+        self.config = config
+        self.settings = settings
+        self.size = (
+            self.self_size
+            + config.nearest_opponents * self.opponent_size
+            + config.nearest_bullets * self.bullet_size
+            + config.nearest_platforms * self.platform_size
+        )
+        # One row per field and a column per entity, so fields are filled
+        # as contiguous runs; the state arrays are transposed views of them
+        self._buffers = {
+            "players": np.zeros((3, 1)),
+            "bots": np.zeros((3, 16)),
+            "bullets": np.zeros((5, 256)),
+        }
+        self._slots = np.zeros(16, dtype=np.intp)
+        self.players = self._buffers["players"][:, :0].T
+        self.bots = self._buffers["bots"][:, :0].T
+        self.bullets = self._buffers["bullets"][:, :0].T
+        self.platforms = np.zeros((0, 4))
+        self._map = None
+
+    def gather(self, simulation) -> None:
+        """
+        Collects player, bot, bullet and platform state from `simulation`.
+        """
+        bullet_layers = ent.CollisionLayers.BULLET.value | ent.CollisionLayers.BULLET_BOT.value
+        store = simulation.store
+        self.players = self._entity_state("players", [simulation.player], store)
+        self.bots = self._entity_state(
+            "bots", simulation.bots + simulation.player_like_bots + simulation.planning_bots, store
+        )
+
+        if store is not None:
+            count = store.count
+            hit = (store.occupied_mask[:count] & bullet_layers) != 0
+            columns = self._columns("bullets", int(np.count_nonzero(hit)))
+            for row, values in zip(columns, (store.x, store.y, store.step_x, store.step_y)):
+                np.compress(hit, values[:count], out=row)
+            columns[4] = store.occupied_mask[:count][hit]
+        else:
+            # Bullets are the only entities on the bullet layers
+            bullets = simulation.registry.bucket(Bullet)
+            columns = self._columns("bullets", len(bullets))
+            if bullets:
+                columns.T[:] = [(b.x, b.y, b.step_x, b.step_y, b.occupied_mask) for b in bullets]
+        self.bullets = columns.T
+
+        # The map is static, so its platforms are read once per map
+        if self._map is not simulation.map:
+            self._map = simulation.map
+            self.platforms = np.array(
+                [(o.x, o.y, o.size[0], o.size[1]) for o in simulation.map.obstacles]
+            ).reshape(-1, 4)
+
+    def _columns(self, name: str, count: int) -> np.ndarray:
+        # The first `count` columns of a buffer, which doubles when too small
+        buffer = self._buffers[name]
+        if buffer.shape[1] < count:
+            buffer = np.zeros((len(buffer), max(count, 2 * buffer.shape[1])))
+            self._buffers[name] = buffer
+        return buffer[:, :count]
+
+    def _entity_state(self, name: str, entities: list, store) -> np.ndarray:
+        columns = self._columns(name, len(entities))
+        if store is not None:
+            if len(self._slots) < len(entities):
+                self._slots = np.zeros(max(len(entities), 2 * len(self._slots)), dtype=np.intp)
+            slots = self._slots[: len(entities)]
+            try:
+                for index, e in enumerate(entities):
+                    slots[index] = e._slot
+            except AttributeError:
+                # An entity that left the game, e.g. the player after dying
+                store = None
+        if store is None:
+            if entities:
+                columns.T[:] = [(e.x, e.y, e.health) for e in entities]
+        else:
+            for row, values in zip(columns, (store.x, store.y, store.health)):
+                np.take(values, slots, out=row)
+        return columns.T
+
+    @staticmethod
+    def _nearest(distances: np.ndarray, count: int, rows: np.ndarray) -> np.ndarray:
+        # Per row, the columns of the `count` smallest distances, nearest
+        # first; `rows` is a column of row numbers for indexing
+        if distances.shape[1] > count:
+            nearest = np.argpartition(distances, count - 1, axis=1)[:, :count]
+            order = np.argsort(distances[rows, nearest], axis=1, kind="stable")
+            return nearest[rows, order]
+        return np.argsort(distances, axis=1, kind="stable")
+
+    # The parts of an observation, in order. A caller that only reads some
+    # of them can skip computing the rest, see `observe_batch`.
+    blocks = ("self", "opponents", "bullets", "platforms")
+
+    # Most agent-by-entity distances computed at once; larger batches are
+    # observed in chunks of agents
+    max_pairs = 1 << 18
+
+    def observe(self, agent: ent.Entity, out: np.ndarray) -> np.ndarray:
+        """
+        Writes the observation of `agent` into `out` and returns it.
+        """
+        self.observe_batch([agent], out.reshape(1, -1))
+        return out
+
+    def observe_batch(
+        self, agents: list, out: np.ndarray, blocks: tuple[str, ...] = blocks
+    ) -> np.ndarray:
+        """
+        Writes the observations of `agents` into the rows of `out`, one per
+        agent, and returns it. Only the given `blocks` are filled in, the
+        others are zero.
+        """
+        state = self._agent_state(agents)
+        widest = max(len(self.bots), len(self.bullets), len(self.platforms), 1)
+        chunk = max(self.max_pairs // widest, 1)
+        if len(agents) <= chunk:
+            self._observe_rows(state, out, blocks)
+            return out
+        for start in range(0, len(agents), chunk):
+            rows = slice(start, start + chunk)
+            self._observe_rows(tuple(column[rows] for column in state), out[rows], blocks)
+        return out
+
+    def _agent_state(self, agents: list) -> tuple[np.ndarray, ...]:
+        # x, y, velocity_y, health, is_falling, occupied and reacts-to masks
+        store = getattr(agents[0], "_store", None) if agents else None
+        if store is not None:
+            try:
+                slots = np.fromiter((agent._slot for agent in agents), np.intp, len(agents))
+            except AttributeError:
+                store = None
+        if store is None:
+            state = np.array(
+                [
+                    (a.x, a.y, a.velocity_y, a.health, a.is_falling)
+                    + (a.occupied_mask, a.reacts_to_mask)
+                    for a in agents
+                ],
+                dtype=float,
+            ).reshape(-1, 7)
+            masks = state[:, 5:].astype(np.int64)
+            return (*state[:, :5].T, masks[:, 0], masks[:, 1])
+        return (
+            store.x[slots],
+            store.y[slots],
+            store.velocity_y[slots],
+            store.health[slots],
+            store.is_falling[slots],
+            store.occupied_mask[slots],
+            store.reacts_to_mask[slots],
+        )
+
+    def _observe_rows(self, state: tuple, out: np.ndarray, blocks: tuple[str, ...]) -> None:
+        settings = self.settings
+        width = settings.map_width
+        height = settings.map_height
+        config = self.config
+        x, y, velocity_y, health, is_falling, occupied, reacts = state
+        count = len(x)
+        every_row = np.arange(count)[:, None]
+        out[:] = 0
+        if "self" in blocks:
+            out[:, 0] = x / width
+            out[:, 1] = y / height
+            out[:, 2] = velocity_y / -settings.player_jump_velocity
+            out[:, 3] = health / settings.player_health
+            out[:, 4] = is_falling
+        start = self.self_size
+
+        block = out[:, start : start + config.nearest_opponents * self.opponent_size]
+        block = block.reshape(count, config.nearest_opponents, self.opponent_size)
+        start += config.nearest_opponents * self.opponent_size
+        if "opponents" in blocks and config.nearest_opponents:
+            is_player = occupied == ent.CollisionLayers.PLAYER.value
+            players = int(np.count_nonzero(is_player))
+            if players in (0, count):
+                # All agents have the same opponents, as in a brain's batch
+                groups = [(slice(None), self.bots if players else self.players)]
+            else:
+                groups = [
+                    (np.flatnonzero(is_player), self.bots),
+                    (np.flatnonzero(~is_player), self.players),
+                ]
+            for rows, opponents in groups:
+                if not len(opponents):
+                    continue
+                dx = opponents[:, 0] - x[rows, None]
+                dy = opponents[:, 1] - y[rows, None]
+                group = every_row[: len(dx)]
+                chosen = self._nearest(dx * dx + dy * dy, config.nearest_opponents, group)
+                found = chosen.shape[1]
+                block[rows, :found, 0] = dx[group, chosen] / width
+                block[rows, :found, 1] = dy[group, chosen] / height
+                block[rows, :found, 2] = opponents[chosen, 2] / settings.player_health
+                block[rows, :found, 3] = 1
+
+        bullets = self.bullets
+        block = out[:, start : start + config.nearest_bullets * self.bullet_size]
+        block = block.reshape(count, config.nearest_bullets, self.bullet_size)
+        start += config.nearest_bullets * self.bullet_size
+        if "bullets" in blocks and config.nearest_bullets and len(bullets):
+            dx = bullets[:, 0] - x[:, None]
+            dy = bullets[:, 1] - y[:, None]
+            chosen = self._nearest(dx * dx + dy * dy, config.nearest_bullets, every_row)
+            found = chosen.shape[1]
+            block[:, :found, 0] = dx[every_row, chosen] / width
+            block[:, :found, 1] = dy[every_row, chosen] / height
+            block[:, :found, 2] = bullets[chosen, 2] / settings.bullet_speed
+            block[:, :found, 3] = bullets[chosen, 3] / settings.bullet_speed
+            block[:, :found, 4] = (bullets[chosen, 4].astype(np.int64) & reacts[:, None]) != 0
+            block[:, :found, 5] = 1
+
+        platforms = self.platforms
+        block = out[:, start : start + config.nearest_platforms * self.platform_size]
+        block = block.reshape(count, config.nearest_platforms, self.platform_size)
+        if "platforms" in blocks and config.nearest_platforms and len(platforms):
+            dx = platforms[:, 0] - x[:, None]
+            dy = platforms[:, 1] - y[:, None]
+            # Distance to the closest point of each platform, so wide
+            # platforms count as near wherever the agent is along them.
+            gap_x = np.maximum(np.abs(dx) - platforms[:, 2] / 2, 0)
+            gap_y = np.maximum(np.abs(dy) - platforms[:, 3] / 2, 0)
+            chosen = self._nearest(
+                gap_x * gap_x + gap_y * gap_y, config.nearest_platforms, every_row
+            )
+            found = chosen.shape[1]
+            block[:, :found, 0] = dx[every_row, chosen] / width
+            block[:, :found, 1] = dy[every_row, chosen] / height
+            block[:, :found, 2] = platforms[chosen, 2] / width
+            block[:, :found, 3] = platforms[chosen, 3] / height
+            block[:, :found, 4] = 1
@@ -0,0 +1,130 @@
+import json
+import time
+
+import numpy as np
+
+
+class Profiler:
+    """
+    Rolling timings of nested sections, keeping the last `window` samples of
+    each.
+
+    Sections are opened with `start` and closed with `stop` and recorded
+    under their `;`-joined path, e.g. `next_step;check_collisions`, which is
+    also the stack format of the flamegraph export. The profiler is off by
+    default and callers check `enabled` before timing anything, so an idle
+    profiler costs one attribute read per instrumented call.
+    """
+
+    def __init__(self, window: int = 600, enabled: bool = False):
+        self.window = window
+        self.enabled = enabled
+        self.values: dict[str, float] = {}
+        self._stack: list[tuple[str, float]] = []
+        self.reset()
+
+    def reset(self) -> None:
+        self._samples: dict[str, np.ndarray] = {}
+        self._counts: dict[str, int] = {}
+        self._totals: dict[str, float] = {}
+
+    def start(self, name: str) -> None:
+        path = f"{self._stack[-1][0]};{name}" if self._stack else name
+        self._stack.append((path, time.perf_counter()))
+
+    def stop(self) -> float:
+        path, start = self._stack.pop()
+        seconds = time.perf_counter() - start
+        self.record(path, seconds)
+        return seconds
+
+    @property
+    def path(self) -> str:
+        """
+        Path of the innermost open section, `""` outside of any.
+        """
+        return self._stack[-1][0] if self._stack else ""
+
+    def record(self, path: str, seconds: float) -> None:
+        samples = self._samples.get(path)
+        if samples is None:
+            samples = self._samples[path] = np.zeros(self.window)
+            self._counts[path] = 0
+            self._totals[path] = 0.0
+        count = self._counts[path]
+        samples[count % self.window] = seconds
+        self._counts[path] = count + 1
+        self._totals[path] += seconds
+
+    def set_value(self, name: str, value: float) -> None:
+        """
+        Stores the latest value of a counter such as the collision pair count.
+        """
+        self.values[name] = value
+
+    def samples(self, path: str) -> np.ndarray:
+        """
+        The rolling window of a section, oldest sample first.
+        """
+        samples = self._samples.get(path)
+        if samples is None:
+            return np.zeros(0)
+        count = self._counts[path]
+        if count <= self.window:
+            return samples[:count].copy()
+        return np.roll(samples, -(count % self.window))
+
+    def mean(self, path: str) -> float:
+        samples = self.samples(path)
+        return float(samples.mean()) if len(samples) else 0.0
+
+    def histogram(self, path: str, bins: int = 20) -> tuple[np.ndarray, np.ndarray]:
+        return np.histogram(self.samples(path), bins=bins)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        Count, total and rolling mean, median, 95th percentile and maximum of
+        every section, in seconds.
+        """
+        summary = {}
+        for path in sorted(self._samples):
+            samples = self.samples(path)
+            summary[path] = {
+                "count": self._counts[path],
+                "total": self._totals[path],
+                "mean": float(samples.mean()),
+                "p50": float(np.percentile(samples, 50)),
+                "p95": float(np.percentile(samples, 95)),
+                "max": float(samples.max()),
+            }
+        return summary
+
+    def collapsed_stacks(self) -> list[str]:
+        """
+        Lines of `path microseconds` with the time spent in each section
+        itself, outside of its subsections. This is the folded format read
+        by flamegraph tools.
+        """
+        children: dict[str, float] = {}
+        for path, total in self._totals.items():
+            parent, _, _ = path.rpartition(";")
+            if parent:
+                children[parent] = children.get(parent, 0.0) + total
+        lines = []
+        for path in sorted(self._totals):
+            own = self._totals[path] - children.get(path, 0.0)
+            lines.append(f"{path} {max(round(own * 1e6), 0)}")
+        return lines
+
+    def export_collapsed(self, path: str) -> None:
+        with open(path, "w") as file:
+            file.write("\n".join(self.collapsed_stacks()) + "\n")
+
+    def export_json(self, path: str, bins: int = 20) -> None:
+        histograms = {}
+        for section in self._samples:
+            counts, edges = self.histogram(section, bins)
+            histograms[section] = {"counts": counts.tolist(), "edges": edges.tolist()}
+        data = {"sections": self.summary(), "histograms": histograms, "values": self.values}
+        with open(path, "w") as file:
+            json.dump(data, file, indent=2)
@@ -0,0 +1,240 @@
+import numpy as np
+
+import characters.entity as ent
+
+# Layers that block line of sight
+SIGHT_BLOCKERS = ent.CollisionLayers.GROUND.value | ent.CollisionLayers.WALL.value
+
+
+class RayCaster:
+    """
+    Batched ray casts against the map and the entities of a game.
+
+    `gather` collects the boxes of the dynamic entities once per tick, after
+    which `cast` shoots any number of rays from any number of origins in one
+    go, e.g. a fan of 64 angles from every bot. A ray stops at the first box
+    it touches. Boxes are closed like the overlap test of
+    `Entity.check_collision`, so a ray starting inside a box stops at 0.
+
+    The map is static, so its obstacles are read once per map and sorted by
+    their left edge, and the entities are sorted the same way when gathered.
+    Each origin then only looks at the boxes within reach, and each ray is
+    only tested against the boxes in its direction.
+    """
+
+    def __init__(self):
+        self._map = None
+        # Obstacle edges as left, top, right, bottom rows: the narrow ones
+        # sorted by left edge, then the wide ones
+        self.static_edges = np.zeros((4, 0))
+        self.static_layers = np.zeros(0, dtype=np.int64)
+        self._narrow = 0
+        self._narrow_width = 0.0
+        # Dynamic boxes sorted by left edge
+        self.layers = np.zeros(0, dtype=np.int64)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self._dynamic_width = 0.0
+        # Static then dynamic boxes
+        self.edges = np.zeros((4, 0))
+        self.box_layers = np.zeros(0, dtype=np.int64)
+
+    def gather(self, simulation) -> None:
+        """
+        Collects the boxes, layers and ids of the dynamic entities in
+        `simulation`.
+        """
+        if self._map is not simulation.map:
+            self._load_map(simulation.map)
+
+        store = simulation.store
+        if store is not None:
+            count = store.count
+            x, y = store.x[:count], store.y[:count]
+            half_width, half_height = store.half_width[:count], store.half_height[:count]
+            layers, ids = store.occupied_mask[:count], store.entity_id[:count]
+        else:
+            x, y, half_width, half_height, layers, ids = np.array(
+                [
+                    (e.x, e.y, e.size[0] / 2, e.size[1] / 2, e.occupied_mask, e.entity_id)
+                    for e in simulation.registry.dynamic()
+                ]
+            ).reshape(-1, 6).T
+        dynamic = np.stack((x - half_width, y - half_height, x + half_width, y + half_height))
+        order = np.argsort(dynamic[0], kind="stable")
+        self.layers = layers.astype(np.int64)[order]
+        self.ids = ids.astype(np.int64)[order]
+        self._dynamic_width = 2 * float(half_width.max(initial=0.0))
+        self.edges = np.concatenate((self.static_edges, dynamic[:, order]), axis=1)
+        self.box_layers = np.concatenate((self.static_layers, self.layers))
+
+    def _load_map(self, game_map) -> None:
+        self._map = game_map
+        left, top, width, height = game_map.boxes.T
+        layers = np.array([o.occupied_mask for o in game_map.obstacles], dtype=np.int64)
+        # Floors and other boxes much wider than the rest would make every
+        # origin scan most of the map, so they are paired with every origin
+        wide = width > 4 * np.median(width) if len(width) else np.zeros(0, dtype=bool)
+        narrow = np.flatnonzero(~wide)
+        order = np.concatenate(
+            (narrow[np.argsort(left[narrow], kind="stable")], np.flatnonzero(wide))
+        )
+        self.static_edges = np.stack((left, top, left + width, top + height))[:, order]
+        self.static_layers = layers[order]
+        self._narrow = len(narrow)
+        self._narrow_width = float(width[narrow].max(initial=0.0))
+
+    def _near(self, x, y, reach, layers, ignore) -> tuple[np.ndarray, np.ndarray]:
+        # (origin, box) pairs with the box within `reach` of the origin
+        narrow = self._narrow
+        dynamic = len(self.box_layers) - len(self.ids)
+        low_x, high_x = x - reach, x + reach
+        low_y, high_y = y - reach, y + reach
+
+        # Narrow obstacles and entities by a search on their left edges
+        rows, columns = self._sweep(0, narrow, self._narrow_width, low_x, high_x, low_y, high_y)
+        dynamic_rows, dynamic_columns = self._sweep(
+            dynamic, len(self.box_layers), self._dynamic_width, low_x, high_x, low_y, high_y
+        )
+        if ignore is not None:
+            keep = self.ids[dynamic_columns - dynamic] != np.asarray(ignore)[dynamic_rows]
+            dynamic_rows, dynamic_columns = dynamic_rows[keep], dynamic_columns[keep]
+
+        # Wide obstacles are few enough to test from every origin
+        left, top, right, bottom = self.edges[:, narrow:dynamic, None]
+        near = (
+            (left <= high_x) & (right >= low_x) & (top <= high_y) & (bottom >= low_y)
+        ).T
+        wide_rows, wide_columns = np.nonzero(near)
+        rows = np.concatenate((rows, wide_rows, dynamic_rows))
+        columns = np.concatenate((columns, wide_columns + narrow, dynamic_columns))
+        if layers is not None:
+            keep = (self.box_layers[columns] & layers) != 0
+            rows, columns = rows[keep], columns[keep]
+        return rows, columns
+
+    def _sweep(self, first, stop, width, low_x, high_x, low_y, high_y):
+        # Pairs with the boxes from `first` to `stop`, which are sorted by
+        # their left edge and at most `width` wide
+        lefts = self.edges[0, first:stop]
+        start = np.searchsorted(lefts, low_x - width, side="left")
+        lengths = np.searchsorted(lefts, high_x, side="right") - start
+        rows = np.repeat(np.arange(len(low_x)), lengths)
+        columns = np.arange(len(rows)) + np.repeat(first + start - np.cumsum(lengths) + lengths, lengths)
+        keep = (
+            (self.edges[2].take(columns) >= low_x[rows])
+            & (self.edges[1].take(columns) <= high_y[rows])
+            & (self.edges[3].take(columns) >= low_y[rows])
+        )
+        return rows[keep], columns[keep]
+
+    def cast(
+        self,
+        x,
+        y,
+        angles,
+        max_distance,
+        layers: int | None = None,
+        ignore=None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Casts rays from the origins `(x, y)` in the directions `angles`, in
+        radians like `shoot`: either one row of angles shared by every origin
+        or one row per origin. Returns `(distances, layers)` arrays of shape
+        `(origins, rays)` holding how far each ray got and the collision
+        layer of what it hit, or `max_distance` and 0 when it hit nothing.
+
+        Only boxes on `layers` are tested when given, and the entity whose id
+        is in `ignore` is skipped for each origin, e.g. the one casting.
+        """
+        x = np.asarray(x, dtype=float).reshape(-1)
+        y = np.asarray(y, dtype=float).reshape(-1)
+        angles = np.asarray(angles, dtype=float)
+        shared = angles.ndim == 1
+        angles = np.broadcast_to(angles, (len(x), angles.shape[-1]))
+        origins, rays = angles.shape
+        max_distance = np.broadcast_to(np.asarray(max_distance, dtype=float), angles.shape)
+        if not max_distance.size:
+            return max_distance.copy(), np.zeros(angles.shape, dtype=np.int64)
+        reach = max_distance.max(axis=1)
+
+        rows, columns = self._near(x, y, reach, layers, ignore)
+        # Box edges relative to their origin
+        edges = self.edges.take(columns, axis=1)
+        edges[0::2] -= x[rows]
+        edges[1::2] -= y[rows]
+
+        # The rays that can hit a box lie within the angle its bounding
+        # circle covers, or are all of them when the origin is inside it
+        offset_x = (edges[0] + edges[2]) / 2
+        offset_y = (edges[1] + edges[3]) / 2
+        width, height = self.edges[2:] - self.edges[:2]
+        radius = (np.sqrt(width * width + height * height) / 2).take(columns)
+        distance = np.sqrt(offset_x * offset_x + offset_y * offset_y)
+        with np.errstate(divide="ignore"):
+            spread = np.where(
+                distance > radius, np.arcsin(np.minimum(radius / distance, 1.0)) + 1e-9, np.pi
+            )
+        low = np.mod(np.arctan2(offset_y, offset_x) - spread, 2 * np.pi)
+
+        # Angles sorted from 0 to 2 pi and again shifted by 2 pi, so each box
+        # covers one run of them. Rows of per-origin angles are spaced apart
+        # so that one search finds all runs.
+        turned = np.mod(angles[:1] if shared else angles, 2 * np.pi)
+        turned[turned >= 2 * np.pi] = 0.0
+        order = np.argsort(turned, axis=1)
+        turned = np.take_along_axis(turned, order, axis=1)
+        keys = np.hstack((turned, turned + 2 * np.pi)) + 16.0 * np.arange(len(turned))[:, None]
+        keys = keys.ravel()
+        key_rows = 0 if shared else rows
+        start = np.searchsorted(keys, low + 16.0 * key_rows, side="left")
+        stop = np.searchsorted(keys, low + 2 * spread + 16.0 * key_rows, side="right")
+        lengths = np.minimum(stop - start, rays)
+
+        # One slab test per ray and box it may hit
+        pairs = np.repeat(np.arange(len(rows)), lengths)
+        first = start - 2 * rays * key_rows - np.cumsum(lengths) + lengths
+        position = (np.arange(len(pairs)) + np.repeat(first, lengths)) % rays
+        pair_rows = rows[pairs]
+        if shared:
+            column = order[0][position]
+            ray = pair_rows * rays + column
+        else:
+            ray = column = pair_rows * rays + order[pair_rows, position]
+        step_x = np.cos(angles[:1] if shared else angles).ravel()
+        step_y = np.sin(angles[:1] if shared else angles).ravel()
+        # Axis-aligned rays would divide by zero
+        step_x[step_x == 0] = 1e-30
+        step_y[step_y == 0] = 1e-30
+        inverse_x = (1 / step_x).take(column)
+        inverse_y = (1 / step_y).take(column)
+        left, top, right, bottom = edges.take(pairs, axis=1)
+        near_x = left * inverse_x
+        far_x = right * inverse_x
+        near_y = top * inverse_y
+        far_y = bottom * inverse_y
+        enter = np.maximum(np.minimum(near_x, far_x), np.minimum(near_y, far_y))
+        exit = np.minimum(np.maximum(near_x, far_x), np.maximum(near_y, far_y))
+        enter = np.where((enter <= exit) & (exit >= 0), np.maximum(enter, 0), np.inf)
+
+        distances = max_distance.ravel().copy()
+        np.minimum.at(distances, ray, enter)
+        hit_layers = np.zeros(origins * rays, dtype=np.int64)
+        nearest = enter == distances[ray]
+        hit_layers[ray[nearest]] = self.box_layers[columns[pairs[nearest]]]
+        return distances.reshape(origins, rays), hit_layers.reshape(origins, rays)
+
+    def line_of_sight(
+        self, x, y, target_x, target_y, layers: int = SIGHT_BLOCKERS, ignore=None
+    ) -> np.ndarray:
+        """
+        Whether nothing on `layers` lies between each origin `(x, y)` and
+        its target.
+        """
+        x = np.asarray(x, dtype=float).reshape(-1)
+        y = np.asarray(y, dtype=float).reshape(-1)
+        dx = np.asarray(target_x, dtype=float).reshape(-1) - x
+        dy = np.asarray(target_y, dtype=float).reshape(-1) - y
+        distance = np.hypot(dx, dy)
+        angles = np.arctan2(dy, dx)[:, None]
+        distances, _ = self.cast(x, y, angles, distance[:, None], layers, ignore)
+        return distances[:, 0] >= distance
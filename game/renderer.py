@@ -5,10 +5,14 @@ from config import (
     GameConfig,
     Color,
     HealthBarConfig,
+    HudConfig,
     WindowConfig,
-    MapConfig,
 )
 import math
+import time
+from dataclasses import replace
+
+import numpy as np
 
 
 class Renderer:
@@ -25,18 +29,57 @@ class Renderer:
         self.a_pressed = False
         self.d_pressed = False
         self.mouse_pressed = False
+        # F3 toggles the performance HUD, which profiles while it is shown
+        self.profiler = simulation.profiler
+        self.show_hud = False
+        self._profiler_was_enabled = self.profiler.enabled
+        self._hud_font = None
+        self._health_font = None
+        # Per health bar row: the label and its rendered text
+        self._health_labels: list[tuple[str, pygame.Surface]] = []
+        self._static_map = None
+        self._static_tiles: dict[tuple[int, int], pygame.Surface] = {}
+        self._sprites: dict[type, tuple[pygame.Surface, float, float]] = {}
+        # Game ticks per real-time tick, changed with + and -
+        self.speed = 1.0
+        # Fraction of a tick the drawn positions are ahead of the previous
+        # tick, and the positions at that tick keyed by entity id
+        self.alpha = 1.0
+        self._previous = None
+        # Interactive games must keep their frame rate, so planning bots
+        # stop at a wall-clock budget unless one was set already. Replays
+        # have no brains.
+        brain = getattr(simulation, "planning_brain", None)
+        if brain is not None and brain.config.budget_ms is None:
+            brain.config = replace(brain.config, budget_ms=self.planning_budget_ms)
 
         self.apply_offsets()
 
 
+    def _health_label(self, row: int, label: str) -> pygame.Surface:
+        """
+        Rendered text of a health bar label, re-rendered only when it changes.
+        """
+        if self._health_font is None:
+            self._health_font = pygame.font.Font(
+                HealthBarConfig().font, HealthBarConfig.font_size
+            )
+        labels = self._health_labels
+        if row == len(labels):
+            labels.append(("", None))
+        cached_label, text = labels[row]
+        if cached_label != label:
+            text = self._health_font.render(label, True, Color().white)
+            labels[row] = (label, text)
+        return text
+
     def draw_healths_bars(self):
         health = self.simulation.player.health
-        font = pygame.font.Font(HealthBarConfig().font, HealthBarConfig.font_size)
         label = f"Player: {health} %"
         y = HealthBarConfig().y
         for nr, bot in enumerate(self.simulation.bots):
             self.screen.blit(
-                font.render(label, True, Color().white), (HealthBarConfig().x, y - 20)
+                self._health_label(nr, label), (HealthBarConfig().x, y - 20)
             )
             pygame.draw.rect(
                 self.screen,
@@ -50,13 +93,204 @@ class Renderer:
             if nr == 2:
                 break
         
-    def draw_frame(self):
-        self.screen.fill(Color().black)
-        for entity in self.simulation.entities:
-            entity.draw(self.screen,self.offset_x, self.offset_y)
+    # Side of the square tiles the static map is pre-rendered into. Tiles
+    # are drawn the first time they come into view and then reused.
+    static_tile_size = 1024
+
+    def _static_tile(self, column: int, row: int) -> pygame.Surface:
+        tile = self._static_tiles.get((column, row))
+        if tile is None:
+            size = self.static_tile_size
+            left, top = column * size, row * size
+            tile = pygame.Surface((size, size)).convert()
+            tile.fill(Color().black)
+            game_map = self.simulation.map
+            for index in game_map.index.overlapping(left, top, left + size, top + size).tolist():
+                game_map.obstacles[index].draw(tile, left, top)
+            self._static_tiles[(column, row)] = tile
+        return tile
+
+    def draw_static_map(self):
+        """
+        Blits the pre-rendered map tiles in view; this also clears the screen.
+        """
+        if self._static_map is not self.simulation.map:
+            self._static_map = self.simulation.map
+            self._static_tiles.clear()
+        size = self.static_tile_size
+        offset_x, offset_y = int(self.offset_x), int(self.offset_y)
+        first_column, first_row = offset_x // size, offset_y // size
+        last_column = (offset_x + WindowConfig().width - 1) // size
+        last_row = (offset_y + WindowConfig().height - 1) // size
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                self.screen.blit(
+                    self._static_tile(column, row),
+                    (column * size - offset_x, row * size - offset_y),
+                )
+
+    def _visible_positions(self) -> dict[type, tuple[list, list]]:
+        """
+        Positions of the moving entities overlapping the camera view, grouped
+        by type.
+        """
+        left, top = self.offset_x, self.offset_y
+        right = left + WindowConfig().width
+        bottom = top + WindowConfig().height
+        registry = self.simulation.registry
+        store = self.simulation.store
+        groups = {}
+        if store is not None:
+            count = store.count
+            x, y = self._interpolated_arrays(
+                store.entity_id[:count], store.x[:count], store.y[:count]
+            )
+            half_width = store.half_width[:count]
+            half_height = store.half_height[:count]
+            slots = np.flatnonzero(
+                (x + half_width >= left)
+                & (x - half_width <= right)
+                & (y + half_height >= top)
+                & (y - half_height <= bottom)
+            )
+            kinds = store.kind[slots]
+            classes = store.kinds
+            for code in np.unique(kinds).tolist():
+                group = slots[kinds == code]
+                cls = classes[code]
+                self._sprite(cls, store.entities[group[0]])
+                groups[cls] = (x[group], y[group])
+            return groups
+
+        for entity in registry.dynamic():
+            x, y = self._interpolated(entity)
+            half_width = entity.size[0] / 2
+            half_height = entity.size[1] / 2
+            if (
+                x + half_width >= left
+                and x - half_width <= right
+                and y + half_height >= top
+                and y - half_height <= bottom
+            ):
+                cls = type(entity)
+                group = groups.get(cls)
+                if group is None:
+                    self._sprite(cls, entity)
+                    group = groups[cls] = ([], [])
+                group[0].append(x)
+                group[1].append(y)
+        return groups
+
+    def remember_positions(self):
+        """
+        Stores where the moving entities are before a tick, so frames drawn
+        before the next tick can be interpolated from there.
+        """
+        registry = self.simulation.registry
+        store = self.simulation.store
+        if store is not None:
+            count = store.count
+            ids = store.entity_id[:count]
+            order = np.argsort(ids)
+            self._previous = (
+                ids[order],
+                store.x[:count][order],
+                store.y[:count][order],
+            )
+        else:
+            self._previous = {
+                entity.entity_id: (entity.x, entity.y) for entity in registry.dynamic()
+            }
+
+    def _interpolated(self, entity) -> tuple[float, float]:
+        x, y = entity.x, entity.y
+        if self._previous is None or self.alpha >= 1:
+            return x, y
+        if self.simulation.store is not None:
+            x, y = self._interpolated_arrays(
+                np.array([entity.entity_id]), np.array([x]), np.array([y])
+            )
+            return float(x[0]), float(y[0])
+        previous = self._previous.get(entity.entity_id)
+        if previous is None:
+            return x, y
+        alpha = self.alpha
+        return previous[0] + (x - previous[0]) * alpha, previous[1] + (y - previous[1]) * alpha
+
+    def _interpolated_arrays(self, ids, x, y) -> tuple[np.ndarray, np.ndarray]:
+        previous = self._previous
+        if previous is None or self.alpha >= 1 or not len(previous[0]):
+            return x, y
+        previous_ids, previous_x, previous_y = previous
+        found = np.minimum(np.searchsorted(previous_ids, ids), len(previous_ids) - 1)
+        known = previous_ids[found] == ids
+        alpha = self.alpha
+        x = np.where(known, previous_x[found] + (x - previous_x[found]) * alpha, x)
+        y = np.where(known, previous_y[found] + (y - previous_y[found]) * alpha, y)
+        return x, y
+
+    def _sprite(self, cls: type, entity) -> tuple[pygame.Surface, float, float]:
+        sprite = self._sprites.get(cls)
+        if sprite is None:
+            surface, anchor_x, anchor_y = entity.sprite()
+            sprite = self._sprites[cls] = (surface.convert(), anchor_x, anchor_y)
+        return sprite
+
+    def draw_entities(self):
+        """
+        Draws the visible moving entities with one `blits` call per type.
+        """
+        for cls, (x, y) in self._visible_positions().items():
+            surface, anchor_x, anchor_y = self._sprites[cls]
+            # Truncated like the float rects passed to pygame.draw
+            left = np.trunc(np.asarray(x) + (anchor_x - self.offset_x)).astype(int).tolist()
+            top = np.trunc(np.asarray(y) + (anchor_y - self.offset_y)).astype(int).tolist()
+            self.screen.blits(
+                [(surface, position) for position in zip(left, top)], doreturn=False
+            )
+
+    def draw_frame(self, alpha: float = 1.0):
+        """
+        Draws the game `alpha` of the way from the previous tick's positions
+        to the current ones.
+        """
+        self.alpha = alpha
+        self.apply_offsets()
+        self.draw_static_map()
+        self.draw_entities()
         self.draw_healths_bars()
+        if self.show_hud:
+            self.draw_hud()
         pygame.display.flip()
 
+    def toggle_hud(self):
+        self.show_hud = not self.show_hud
+        if self.show_hud:
+            self._profiler_was_enabled = self.profiler.enabled
+            self.profiler.enabled = True
+        else:
+            self.profiler.enabled = self._profiler_was_enabled
+
+    def draw_hud(self):
+        config = HudConfig()
+        if self._hud_font is None:
+            self._hud_font = pygame.font.Font(config.font, config.font_size)
+        profiler = self.profiler
+        lines = [
+            f"fps {self.clock.get_fps():.0f}",
+            f"frame {profiler.mean('frame') * 1000:.2f} ms",
+            f"tick {profiler.mean('frame;next_step') * 1000:.2f} ms",
+            f"draw {profiler.mean('frame;draw_frame') * 1000:.2f} ms",
+            f"collision pairs {profiler.values.get('collision_pairs', 0)}",
+        ]
+        for name, count in self.simulation.layer_counts().items():
+            lines.append(f"{name.lower()} {count}")
+        y = config.y
+        for line in lines:
+            text = self._hud_font.render(line, True, config.color)
+            self.screen.blit(text, (WindowConfig().width - config.x - text.get_width(), y))
+            y += config.line_height
+
     def handle_mouse_and_keyborad_input(self, event):
         if event.type == pygame.QUIT:
             self.simulation.game_over = True
@@ -71,6 +305,12 @@ class Renderer:
                 self.simulation.player.jump()
             elif event.key == pygame.K_ESCAPE:
                 self.s_pressed = self.simulation.game_over = True
+            elif event.key == pygame.K_F3:
+                self.toggle_hud()
+            elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                self.speed = min(self.speed * 2, self.max_speed)
+            elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                self.speed /= 2
         elif event.type == pygame.KEYUP:
             if event.key == pygame.K_a:
                 self.a_pressed = False
@@ -100,36 +340,72 @@ class Renderer:
         self.simulation.player_shoot(direction)
 
     def apply_offsets(self):
+        player_x, player_y = self._interpolated(self.simulation.player)
         self.offset_x = (
-            self.simulation.player.x
+            player_x
             + PlayerConfig().width / 2
             - WindowConfig().width / 2
         )
         self.offset_x = max(
-            0, min(self.offset_x, MapConfig().width - WindowConfig().width)
+            0, min(self.offset_x, self.simulation.map.width - WindowConfig().width)
         )
 
         self.offset_y = (
-            self.simulation.player.y
+            player_y
             + PlayerConfig().height /2
             - WindowConfig().height / 2
         )
         self.offset_y = max(
-            0, min(self.offset_y, MapConfig().height - WindowConfig().height)
+            0, min(self.offset_y, self.simulation.map.height - WindowConfig().height)
         )
 
+    max_speed = 16.0
+    # Milliseconds per tick all planning bots may plan for while playing
+    planning_budget_ms = 2.0
+    # Real time caught up at most per frame. When ticks take longer than
+    # that the game slows down instead of falling ever further behind.
+    max_frame_seconds = 0.25
+
     def run(self):
+        """
+        Runs the game at `settings.fps` ticks per second of real time, times
+        `speed`, independently of the frame rate: each frame runs as many
+        ticks as are due and draws positions interpolated between the last
+        two ticks.
+        """
+        profiler = self.profiler
+        tick_seconds = 1 / self.simulation.settings.fps
+        behind = 0.0
+        previous_time = time.perf_counter()
         while not self.simulation.game_over:
-            self.apply_offsets()
+            # Checked once per frame so a toggle mid-frame keeps sections paired
+            profiling = profiler.enabled
+            if profiling:
+                profiler.start("frame")
+                profiler.start("events")
+
+            now = time.perf_counter()
+            behind += min(now - previous_time, self.max_frame_seconds) * self.speed
+            previous_time = now
 
             for event in pygame.event.get():
                 self.handle_mouse_and_keyborad_input(event)
+            if profiling:
+                profiler.stop()
 
-            self.player_move()
-
-            if self.mouse_pressed:
-                self.player_shoot()
+            while behind >= tick_seconds and not self.simulation.game_over:
+                # Input is applied per tick, so it acts the same at any speed
+                self.player_move()
+                if self.mouse_pressed:
+                    self.player_shoot()
+                self.remember_positions()
+                self.simulation.next_step()
+                behind -= tick_seconds
 
-            self.draw_frame()
-            self.simulation.next_step()
+            if profiling:
+                profiler.start("draw_frame")
+            self.draw_frame(behind / tick_seconds)
+            if profiling:
+                profiler.stop()
+                profiler.stop()
             self.clock.tick(GameConfig().fps)
@@ -0,0 +1,549 @@
+"""
+Replay files are append-only:
+
+    header | record* | index
+
+The header holds the frame rate, keyframe interval and map geometry. Each
+record is a `kind, frame, length` header and a payload: a type definition
+(the entity sprite, so replays play without the game classes), a keyframe
+with the full state, or a delta against the previous frame. Positions are
+stored in 1/16 pixel units, and moves small enough for int16 are stored as
+deltas. The index at the end lists the record offsets; a file without one
+(e.g. from a crashed run) is scanned once on opening instead.
+"""
+import bisect
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+import pygame
+
+from characters.bots import Bot
+from characters.player import Player
+import characters.entity as ent
+from config import MapConfig
+from game.profiler import Profiler
+from map.loader import obstacles_from_boxes
+from map.map import Map
+
+MAGIC = b"PGRP"
+INDEX_MAGIC = b"PGIX"
+VERSION = 1
+COMPRESSED = 1
+
+TYPE, KEYFRAME, DELTA = 0, 1, 2
+ROLE_OTHER, ROLE_PLAYER, ROLE_BOT = 0, 1, 2
+
+# Positions are stored as integers in these fractions of a pixel
+POSITION_SCALE = 16
+
+_HEADER = struct.Struct("<4sHHHIIII")
+_RECORD = struct.Struct("<BII")
+_FOOTER = struct.Struct("<QI4s")
+_TYPE = struct.Struct("<HBffHHB3BB")
+
+_STATE_FIELDS = (
+    ("ids", np.int32),
+    ("types", np.uint16),
+    ("layers", np.uint8),
+    ("x", np.int32),
+    ("y", np.int32),
+    ("health", np.float32),
+)
+
+
+def _pack_arrays(*arrays: np.ndarray) -> bytes:
+    parts = []
+    for array in arrays:
+        parts.append(struct.pack("<I", len(array)))
+        parts.append(array.tobytes())
+    return b"".join(parts)
+
+
+def _unpack_arrays(payload: bytes, dtypes) -> list[np.ndarray]:
+    arrays = []
+    position = 0
+    for dtype in dtypes:
+        (count,) = struct.unpack_from("<I", payload, position)
+        position += 4
+        array = np.frombuffer(payload, dtype=dtype, count=count, offset=position)
+        position += array.nbytes
+        arrays.append(array)
+    return arrays
+
+
+class ReplayRecorder:
+    """
+    Streams the moving entities of a simulation into a replay file, one
+    frame per tick. A keyframe is written every `keyframe_interval` frames
+    and whenever the game is reset, so any frame is at most that many deltas
+    away from a full state.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        simulation,
+        keyframe_interval: int = 300,
+        compress: bool = True,
+    ):
+        self.keyframe_interval = keyframe_interval
+        self.compress = compress
+        self.frames = 0
+        self._file = open(path, "wb")
+        self._offsets: list[int] = []
+        self._keyframes: list[int] = []
+        self._type_offsets: list[int] = []
+        self._type_codes: dict[type, int] = {}
+        self._previous: dict[str, np.ndarray] | None = None
+        self._registry = None
+
+        boxes = simulation.map.boxes.astype(np.float32)
+        self._file.write(
+            _HEADER.pack(
+                MAGIC,
+                VERSION,
+                COMPRESSED if compress else 0,
+                simulation.settings.fps,
+                keyframe_interval,
+                simulation.map.width,
+                simulation.map.height,
+                len(boxes),
+            )
+        )
+        self._file.write(boxes.tobytes())
+        self.capture(simulation)
+
+    def _write_record(self, kind: int, payload: bytes) -> int:
+        if self.compress:
+            payload = zlib.compress(payload, 1)
+        offset = self._file.tell()
+        self._file.write(_RECORD.pack(kind, self.frames, len(payload)))
+        self._file.write(payload)
+        return offset
+
+    def _type_code(self, cls: type, entity) -> int:
+        code = self._type_codes.get(cls)
+        if code is None:
+            code = self._type_codes[cls] = len(self._type_codes)
+            surface, anchor_x, anchor_y = entity.sprite()
+            colorkey = surface.get_colorkey()
+            role = (
+                ROLE_BOT if issubclass(cls, Bot)
+                else ROLE_PLAYER if issubclass(cls, Player)
+                else ROLE_OTHER
+            )
+            name = cls.__name__.encode()
+            payload = (
+                _TYPE.pack(
+                    code,
+                    role,
+                    anchor_x,
+                    anchor_y,
+                    surface.get_width(),
+                    surface.get_height(),
+                    colorkey is not None,
+                    *(colorkey[:3] if colorkey is not None else (0, 0, 0)),
+                    len(name),
+                )
+                + name
+                + pygame.image.tobytes(surface, "RGB")
+            )
+            self._type_offsets.append(self._write_record(TYPE, payload))
+        return code
+
+    def _state(self, simulation) -> dict[str, np.ndarray]:
+        registry = simulation.registry
+        store = simulation.store
+        if store is not None:
+            count = store.count
+            kinds = store.kind[:count]
+            present, first = np.unique(kinds, return_index=True)
+            classes = store.kinds
+            codes = np.zeros(len(classes), dtype=np.uint16)
+            for kind, slot in zip(present.tolist(), first.tolist()):
+                codes[kind] = self._type_code(classes[kind], store.entities[slot])
+            state = {
+                "ids": store.entity_id[:count].astype(np.int32),
+                "types": codes[kinds],
+                "layers": store.occupied_mask[:count].astype(np.uint8),
+                "x": np.rint(store.x[:count] * POSITION_SCALE).astype(np.int32),
+                "y": np.rint(store.y[:count] * POSITION_SCALE).astype(np.int32),
+                "health": store.health[:count].astype(np.float32),
+            }
+        else:
+            entities = list(registry.dynamic())
+            state = {
+                "ids": np.array([e.entity_id for e in entities], dtype=np.int32),
+                "types": np.array(
+                    [self._type_code(type(e), e) for e in entities], dtype=np.uint16
+                ),
+                "layers": np.array([e.occupied_mask for e in entities], dtype=np.uint8),
+                "x": np.rint(np.array([e.x for e in entities], dtype=float) * POSITION_SCALE).astype(np.int32),
+                "y": np.rint(np.array([e.y for e in entities], dtype=float) * POSITION_SCALE).astype(np.int32),
+                "health": np.array([e.health for e in entities], dtype=np.float32),
+            }
+        order = np.argsort(state["ids"], kind="stable")
+        return {name: array[order] for name, array in state.items()}
+
+    def capture(self, simulation) -> None:
+        """
+        Appends the current state of `simulation` as the next frame.
+        """
+        state = self._state(simulation)
+        previous = self._previous
+        reset = simulation.registry is not self._registry
+        if reset or previous is None or self.frames % self.keyframe_interval == 0:
+            self._registry = simulation.registry
+            payload = struct.pack("<i", simulation.player.entity_id) + _pack_arrays(
+                *(state[name] for name, _ in _STATE_FIELDS)
+            )
+            self._keyframes.append(len(self._offsets))
+            self._offsets.append(self._write_record(KEYFRAME, payload))
+        else:
+            self._offsets.append(self._write_record(DELTA, self._delta(previous, state)))
+        self._previous = state
+        self.frames += 1
+
+    @staticmethod
+    def _delta(previous: dict, state: dict) -> bytes:
+        _, old, new = np.intersect1d(
+            previous["ids"], state["ids"], assume_unique=True, return_indices=True
+        )
+        # An id whose type or layer changed is treated as a new entity
+        same = (previous["types"][old] == state["types"][new]) & (
+            previous["layers"][old] == state["layers"][new]
+        )
+        old, new = old[same], new[same]
+        kept = np.zeros(len(state["ids"]), dtype=bool)
+        kept[new] = True
+        survived = np.zeros(len(previous["ids"]), dtype=bool)
+        survived[old] = True
+
+        ids = state["ids"][new]
+        dx = state["x"][new].astype(np.int64) - previous["x"][old]
+        dy = state["y"][new].astype(np.int64) - previous["y"][old]
+        moved = (dx != 0) | (dy != 0)
+        small = (np.abs(dx) <= 32767) & (np.abs(dy) <= 32767)
+        moves = moved & small
+        jumps = moved & ~small
+        healed = state["health"][new] != previous["health"][old]
+        spawned = ~kept
+
+        return _pack_arrays(
+            *(state[name][spawned] for name, _ in _STATE_FIELDS),
+            previous["ids"][~survived],
+            ids[moves],
+            dx[moves].astype(np.int16),
+            dy[moves].astype(np.int16),
+            ids[jumps],
+            state["x"][new][jumps],
+            state["y"][new][jumps],
+            ids[healed],
+            state["health"][new][healed],
+        )
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        self._file.write(
+            _pack_arrays(
+                np.array(self._offsets, dtype=np.int64),
+                np.array(self._keyframes, dtype=np.int64),
+                np.array(self._type_offsets, dtype=np.int64),
+            )
+        )
+        self._file.write(_FOOTER.pack(index_offset, self.frames, INDEX_MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReplayType:
+    def __init__(self, name: str, role: int, sprite: pygame.Surface, anchor_x: float, anchor_y: float):
+        self.name = name
+        self.role = role
+        self.sprite = sprite
+        self.anchor_x = anchor_x
+        self.anchor_y = anchor_y
+
+
+class ReplayReader:
+    """
+    Random access to the frames of a replay file, read through a memory map.
+    A frame is rebuilt from the closest keyframe before it, so seeking costs
+    at most `keyframe_interval` deltas however long the replay is.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._data
+        magic, version, flags, fps, interval, width, height, boxes = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} replay file")
+        self.compressed = bool(flags & COMPRESSED)
+        self.fps = fps
+        self.keyframe_interval = interval
+        self.map_config = MapConfig(width=width, height=height)
+        self.boxes = np.frombuffer(data, np.float32, boxes * 4, _HEADER.size).reshape(-1, 4).copy()
+        self._records_start = _HEADER.size + self.boxes.nbytes
+        self._map = None
+
+        magic_at = len(data) - _FOOTER.size
+        if magic_at >= self._records_start and data[magic_at + 12 : magic_at + 16] == INDEX_MAGIC:
+            index_offset, _, _ = _FOOTER.unpack_from(data, magic_at)
+            offsets, keyframes, type_offsets = _unpack_arrays(
+                data[index_offset:magic_at], (np.int64, np.int64, np.int64)
+            )
+            self._offsets = offsets.tolist()
+            self._keyframes = keyframes.tolist()
+            type_offsets = type_offsets.tolist()
+        else:
+            type_offsets = self._scan(magic_at + _FOOTER.size)
+
+        self.types: list[ReplayType] = []
+        for offset in type_offsets:
+            self._read_type(self._payload(offset))
+        self._cache: tuple[int, dict] | None = None
+
+    def _scan(self, end: int) -> list[int]:
+        self._offsets = []
+        self._keyframes = []
+        type_offsets = []
+        position = self._records_start
+        while position + _RECORD.size <= end:
+            kind, frame, length = _RECORD.unpack_from(self._data, position)
+            if position + _RECORD.size + length > end:
+                break  # cut off mid-record
+            if kind > DELTA or frame != len(self._offsets):
+                break  # a partly written index
+            if kind == TYPE:
+                type_offsets.append(position)
+            else:
+                if kind == KEYFRAME:
+                    self._keyframes.append(len(self._offsets))
+                self._offsets.append(position)
+            position += _RECORD.size + length
+        return type_offsets
+
+    def _payload(self, offset: int) -> bytes:
+        _, _, length = _RECORD.unpack_from(self._data, offset)
+        start = offset + _RECORD.size
+        payload = self._data[start : start + length]
+        return zlib.decompress(payload) if self.compressed else payload
+
+    def _read_type(self, payload: bytes) -> None:
+        code, role, anchor_x, anchor_y, width, height, keyed, *rest = _TYPE.unpack_from(payload)
+        colorkey, name_length = rest[:3], rest[3]
+        start = _TYPE.size
+        name = payload[start : start + name_length].decode()
+        pixels = payload[start + name_length : start + name_length + width * height * 3]
+        sprite = pygame.image.frombytes(pixels, (width, height), "RGB")
+        if keyed:
+            sprite.set_colorkey(colorkey)
+        while len(self.types) <= code:
+            self.types.append(None)
+        self.types[code] = ReplayType(name, role, sprite, anchor_x, anchor_y)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    @property
+    def map(self) -> Map:
+        if self._map is None:
+            self._map = Map(obstacles_from_boxes(self.boxes), self.map_config)
+        return self._map
+
+    def state(self, frame: int) -> dict[str, np.ndarray]:
+        """
+        The entity state of `frame` as arrays sorted by entity id, with
+        positions in pixels, plus the `player_id`.
+        """
+        if not 0 <= frame < len(self):
+            raise IndexError(f"frame {frame} is not in the replay")
+        start = self._keyframes[bisect.bisect_right(self._keyframes, frame) - 1]
+        cached = self._cache
+        # Playing forward continues from the last frame read
+        if cached is not None and start <= cached[0] <= frame:
+            start, state = cached
+        else:
+            state = self._read_keyframe(self._payload(self._offsets[start]))
+        for index in range(start + 1, frame + 1):
+            state = self._apply_delta(state, self._payload(self._offsets[index]))
+        self._cache = (frame, state)
+        result = dict(state)
+        result["x"] = state["x"] / POSITION_SCALE
+        result["y"] = state["y"] / POSITION_SCALE
+        return result
+
+    @staticmethod
+    def _read_keyframe(payload: bytes) -> dict:
+        (player_id,) = struct.unpack_from("<i", payload)
+        arrays = _unpack_arrays(payload[4:], [dtype for _, dtype in _STATE_FIELDS])
+        state = {name: array.copy() for (name, _), array in zip(_STATE_FIELDS, arrays)}
+        state["player_id"] = player_id
+        return state
+
+    @staticmethod
+    def _apply_delta(state: dict, payload: bytes) -> dict:
+        dtypes = [dtype for _, dtype in _STATE_FIELDS]
+        dtypes += [np.int32, np.int32, np.int16, np.int16, np.int32, np.int32, np.int32, np.int32, np.float32]
+        arrays = _unpack_arrays(payload, dtypes)
+        spawned = dict(zip((name for name, _ in _STATE_FIELDS), arrays[:6]))
+        despawned, move_ids, dx, dy, jump_ids, jump_x, jump_y, heal_ids, health = arrays[6:]
+
+        keep = ~np.isin(state["ids"], despawned)
+        fields = {name: state[name][keep] for name, _ in _STATE_FIELDS}
+        ids = fields["ids"]
+        moved = np.searchsorted(ids, move_ids)
+        fields["x"][moved] += dx
+        fields["y"][moved] += dy
+        jumped = np.searchsorted(ids, jump_ids)
+        fields["x"][jumped] = jump_x
+        fields["y"][jumped] = jump_y
+        fields["health"][np.searchsorted(ids, heal_ids)] = health
+
+        if len(spawned["ids"]):
+            fields = {
+                name: np.concatenate((fields[name], spawned[name])) for name, _ in _STATE_FIELDS
+            }
+            order = np.argsort(fields["ids"], kind="stable")
+            fields = {name: array[order] for name, array in fields.items()}
+        fields["player_id"] = state["player_id"]
+        return fields
+
+    def close(self) -> None:
+        self._data.close()
+        self._file.close()
+
+
+class ReplayEntity:
+    """
+    Stand-in for a recorded entity, drawn with the sprite stored in the replay.
+    """
+
+    is_static = False
+
+    def __init__(self, entity_id: int, replay_type: ReplayType):
+        self.entity_id = entity_id
+        self.type = replay_type
+        self.size = [
+            replay_type.sprite.get_width(),
+            replay_type.sprite.get_height(),
+        ]
+        self.x = self.y = 0.0
+        self.health = 0.0
+        self.occupied_mask = 0
+
+    def sprite(self) -> tuple[pygame.Surface, float, float]:
+        return self.type.sprite, self.type.anchor_x, self.type.anchor_y
+
+    # Replays ignore player input
+    def move(self, right: bool):
+        pass
+
+    def jump(self):
+        pass
+
+
+class _ReplayRegistry:
+    def __init__(self):
+        self.entities: list[ReplayEntity] = []
+
+    def dynamic(self):
+        return iter(self.entities)
+
+
+class ReplayPlayback:
+    """
+    Plays a replay through `Renderer` in place of a `Simulation`: every
+    `next_step` shows the next frame, and `seek` jumps to any frame.
+    """
+
+    def __init__(self, reader: ReplayReader, profiler: Profiler | None = None):
+        self.reader = reader
+        self.map = reader.map
+        self.settings = self.map.settings()
+        self.settings.fps = reader.fps
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.store = None
+        self.registry = _ReplayRegistry()
+        self.game_over = False
+        self.frame = 0
+        # One class per recorded type, so the renderer caches one sprite each
+        self._classes = [
+            type(t.name, (ReplayEntity,), {}) if t is not None else None
+            for t in reader.types
+        ]
+        self._entities: dict[int, ReplayEntity] = {}
+        self.player = ReplayEntity(-1, ReplayType("Player", ROLE_PLAYER, pygame.Surface((1, 1)), 0, 0))
+        self.bots: list[ReplayEntity] = []
+        self.seek(0)
+
+    def seek(self, frame: int) -> None:
+        self.frame = frame
+        state = self.reader.state(frame)
+        entities = {}
+        for entity_id, code, layer, x, y, health in zip(
+            state["ids"].tolist(),
+            state["types"].tolist(),
+            state["layers"].tolist(),
+            state["x"].tolist(),
+            state["y"].tolist(),
+            state["health"].tolist(),
+        ):
+            entity = self._entities.get(entity_id)
+            if entity is None or entity.type is not self.reader.types[code]:
+                entity = self._classes[code](entity_id, self.reader.types[code])
+            entity.x, entity.y, entity.health = x, y, health
+            entity.occupied_mask = layer
+            entities[entity_id] = entity
+        self._entities = entities
+        self.registry.entities = list(entities.values())
+        self.player = entities.get(state["player_id"], self.player)
+        self.bots = [e for e in self.registry.entities if e.type.role == ROLE_BOT]
+
+    def next_step(self) -> None:
+        if self.frame + 1 >= len(self.reader):
+            self.game_over = True
+            return
+        self.seek(self.frame + 1)
+
+    def player_shoot(self, direction: float) -> None:
+        pass
+
+    def layer_counts(self) -> dict[str, int]:
+        layers = [layer for layer in ent.CollisionLayers if layer.value]
+        counts = dict.fromkeys((layer.name for layer in layers), 0)
+        for entity in self.registry.entities:
+            for layer in layers:
+                if entity.occupied_mask & layer.value:
+                    counts[layer.name] += 1
+        return counts
+
+
+def main() -> None:
+    import argparse
+
+    from game.renderer import Renderer
+
+    parser = argparse.ArgumentParser(description="Plays a replay file.")
+    parser.add_argument("path")
+    parser.add_argument("--frame", type=int, default=0, help="frame to start from")
+    args = parser.parse_args()
+
+    playback = ReplayPlayback(ReplayReader(args.path))
+    playback.seek(args.frame)
+    Renderer(playback).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Callable
+
+import numpy as np
+
+from game.simulation import Simulation
+from game.vec_env import VecEnv
+
+
+def random_policy(observations: np.ndarray) -> np.ndarray:
+    """
+    Uniformly random `(move, jump, shoot, aim)` actions for a batch of observations.
+    """
+    actions = np.random.uniform(0, 1, (len(observations), Simulation.action_size))
+    actions[:, 0] = actions[:, 0] * 2 - 1
+    actions[:, 3] *= 2 * np.pi
+    return actions
+
+
+def _rollout_shapes(num_workers: int, envs_per_worker: int, horizon: int) -> dict:
+    batch = (num_workers, envs_per_worker, horizon)
+    return {
+        "observations": (batch + (Simulation.observation_size,), np.float64),
+        "actions": (batch + (Simulation.action_size,), np.float64),
+        "rewards": (batch, np.float64),
+        "dones": (batch, np.bool_),
+    }
+
+
+def _attach(blocks: dict, shapes: dict) -> dict[str, np.ndarray]:
+    return {
+        name: np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+        for name, (shape, dtype) in shapes.items()
+    }
+
+
+def _rollout_worker(
+    remote,
+    worker_id: int,
+    seed: int,
+    block_names: dict[str, str],
+    shapes: dict,
+    env_fn: Callable[[], Simulation],
+    policy: Callable[[np.ndarray], np.ndarray],
+    max_episode_ticks: int | None,
+):
+    np.random.seed(seed + worker_id)
+    blocks = {
+        name: shared_memory.SharedMemory(name=block_name)
+        for name, block_name in block_names.items()
+    }
+    arrays = {name: array[worker_id] for name, array in _attach(blocks, shapes).items()}
+    envs_per_worker, horizon = arrays["rewards"].shape
+    env = VecEnv([env_fn] * envs_per_worker, max_episode_ticks)
+    observations = env.reset(seed + worker_id * envs_per_worker)
+    while True:
+        command = remote.recv()
+        if command == "collect":
+            for step in range(horizon):
+                actions = policy(observations)
+                arrays["observations"][:, step] = observations
+                arrays["actions"][:, step] = actions
+                observations, rewards, dones, _ = env.step(actions)
+                arrays["rewards"][:, step] = rewards
+                arrays["dones"][:, step] = dones
+            remote.send(True)
+        elif command == "close":
+            del arrays
+            for block in blocks.values():
+                block.close()
+            remote.close()
+            break
+
+
+class RolloutPool:
+    """
+    Collects rollouts from worker processes that each own `envs_per_worker`
+    simulations.
+
+    Workers write straight into shared memory, so `collect` returns arrays of
+    shape `(num_workers, envs_per_worker, horizon, ...)` without pickling any
+    trajectories. Simulation `j` of worker `i` is seeded with
+    `seed + i * envs_per_worker + j`, and the worker seeds `numpy.random`
+    for its policy with `seed + i`. The returned arrays are overwritten by
+    the next `collect`.
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        envs_per_worker: int,
+        horizon: int,
+        policy: Callable[[np.ndarray], np.ndarray] = random_policy,
+        env_fn: Callable[[], Simulation] = Simulation,
+        seed: int = 0,
+        max_episode_ticks: int | None = None,
+        start_method: str | None = None,
+    ):
+        self.num_workers = num_workers
+        self.envs_per_worker = envs_per_worker
+        self.horizon = horizon
+        shapes = _rollout_shapes(num_workers, envs_per_worker, horizon)
+        self._blocks = {
+            name: shared_memory.SharedMemory(
+                create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            )
+            for name, (shape, dtype) in shapes.items()
+        }
+        self.rollouts = _attach(self._blocks, shapes)
+
+        context = mp.get_context(start_method)
+        self.remotes = []
+        self.processes = []
+        block_names = {name: block.name for name, block in self._blocks.items()}
+        for worker_id in range(num_workers):
+            remote, worker_remote = context.Pipe()
+            process = context.Process(
+                target=_rollout_worker,
+                args=(
+                    worker_remote,
+                    worker_id,
+                    seed,
+                    block_names,
+                    shapes,
+                    env_fn,
+                    policy,
+                    max_episode_ticks,
+                ),
+                daemon=True,
+            )
+            process.start()
+            worker_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+        self.closed = False
+
+    @property
+    def steps_per_collect(self) -> int:
+        return self.num_workers * self.envs_per_worker * self.horizon
+
+    def collect(self) -> dict[str, np.ndarray]:
+        for remote in self.remotes:
+            remote.send("collect")
+        for remote in self.remotes:
+            remote.recv()
+        return self.rollouts
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send("close")
+        for process in self.processes:
+            process.join()
+        self.rollouts = {}
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+        self.closed = True
@@ -1,99 +1,586 @@
+import copy
+import os
+import time
+from typing import Callable
+
 from map.map import Map
+from map.loader import load_map
 from characters.player import Player
-from characters.bots import Bot, BotSprinter, PlayerLikeBot
-import random
+from characters.bots import Bot, BotSprinter, PlanningBot, PlayerLikeBot
 import math
 from characters.bullet import Bullet
+from characters.bullet_pool import BulletPool
 import characters.entity as ent
+from game.spatial_hash import SpatialHash
+from game.entity_store import EntityStore
+from game.entity_registry import EntityRegistry, StaticEntities
+from game.clock import SimulationClock
+from game.observation import ObservationBuilder
+from game.profiler import Profiler
+from game.raycast import RayCaster
+from game.snapshot import SimulationSnapshot
+from characters.brains import Brain, ChaseBrain, PlanningBrain, RandomBrain
+import numpy as np
 
-from config import MapConfig
+from config import GameSettings, PlannerConfig
 
 
 class Simulation:
-    def __init__(self):
-        self.game_over = False
+    def __init__(
+        self,
+        array_backed: bool = False,
+        clock: SimulationClock | None = None,
+        seed: int | None = None,
+        settings: GameSettings | None = None,
+        game_map: Map | str | os.PathLike | None = None,
+        profiler: Profiler | None = None,
+        planning_bots: int = 0,
+        planner: PlannerConfig = PlannerConfig(),
+    ):
+        """
+        With `array_backed` the entities are stored in an `EntityStore` and
+        updated, collided and culled in batched NumPy operations. All
+        randomness comes from one generator seeded with `seed`, so equal
+        seeds give identical games. `settings` are shared by every entity
+        and default to the map's. `game_map` is a `Map` or a map file path;
+        without it the built-in level is played. The map's obstacles are
+        only read, so any number of simulations can share one `Map`. Ticks
+        are timed per phase while `profiler` is enabled. Every game also has
+        `planning_bots` bots that plan ahead as set by `planner`.
+        """
+        self.profiler = profiler if profiler is not None else Profiler()
+        # The map is static, so it is loaded once and kept across resets
+        if game_map is None:
+            game_map = Map()
+        elif not isinstance(game_map, Map):
+            game_map = load_map(game_map)
+        self.map: Map = game_map
+        # Obstacles never change, so every game and fork shares them
+        self.statics = StaticEntities(self.map.obstacles)
+        self.settings = settings if settings is not None else self.map.settings()
+        self.rng = np.random.default_rng(seed)
+        self.clock = clock if clock is not None else SimulationClock(self.settings.fps)
+        self.array_backed = array_backed
         self.draw_graphics = True
-        self.player: Player = Player()
+        self.observation_builder = ObservationBuilder(settings=self.settings)
+        self.observation = np.zeros(self.observation_builder.size)
+        self.ray_caster = RayCaster()
+        self.chase_brain: Brain = ChaseBrain()
+        self.sprint_brain: Brain = ChaseBrain(noise_degrees=0)
+        self.random_brain: Brain = RandomBrain()
+        self.planning_brain: Brain = PlanningBrain(planner)
+        self.planning_bot_count = planning_bots
+        self._brain_observations: dict[Brain, np.ndarray] = {}
+        self.store: EntityStore | None = None
+        self._retired_bullets: list[Bullet] = []
+        # `_death_handlers` entries resolved per entity type
+        self._resolved_death_handlers: dict[type, Callable] = {}
+        self.recorder = None
+        self.reset()
+
+    def reset(
+        self, out: np.ndarray | None = None, seed: int | None = None
+    ) -> np.ndarray:
+        """
+        Starts a new game on the same clock and returns the first observation,
+        written into `out` if given. Without `seed` the random stream carries
+        on from the previous game.
+        """
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.clock.tick = 0
+        self.game_over = False
+        self.kills = 0
+        self.player: Player = Player(self.rng, self.settings)
         self.bullets: list[Bullet] = []
-        self.map: Map = Map()
+        self.bullet_pool = BulletPool()
+
+        self.store = (
+            EntityStore(settings=self.settings, statics=self.statics)
+            if self.array_backed
+            else None
+        )
+        # Static entities come first and keep their map order, so entity `i`
+        # is `self.map.obstacles[i]` for every obstacle
+        self.registry = EntityRegistry(self.store, self.statics)
+        self.entities : list[ent.Entity] = self.registry.entities
+
+        self.add_entity(self.player)
 
         # Initializing bots
         self.bots: list[Bot] = []
-        self.player_like_bots: list[PlayerLikeBot] = []
-        self.entities : list[ent.Entity] = []
-        
-        self.entities.append(self.player)
-        
-        for obstacle in self.map.obstacles:
-            self.entities.append(obstacle)
-        
+        self.player_like_bots: list[PlayerLikeBot] = self.registry.bucket(PlayerLikeBot)
         for _ in range(2):
-            bot = Bot(self.player)
-            bot_sprinter = BotSprinter(self.player)
-            player_like_bot = PlayerLikeBot()
+            bot = Bot(self.player, self.rng, self.settings)
+            bot_sprinter = BotSprinter(self.player, self.clock, self.rng, self.settings)
+            player_like_bot = PlayerLikeBot(self.rng, self.settings)
+            bot.brain = self.chase_brain
+            bot_sprinter.brain = self.sprint_brain
+            player_like_bot.brain = self.random_brain
             self.bots.append(bot)
             self.bots.append(bot_sprinter)
-            self.player_like_bots.append(player_like_bot)
-            self.entities.extend((bot,bot_sprinter,player_like_bot))
+            for entity in (bot, bot_sprinter, player_like_bot):
+                self.add_entity(entity)
+
+        self.planning_bots: list[PlanningBot] = self.registry.bucket(PlanningBot)
+        for _ in range(self.planning_bot_count):
+            planning_bot = PlanningBot(self.rng, self.settings)
+            planning_bot.brain = self.planning_brain
+            self.add_entity(planning_bot)
+
+        # The new game's first frame starts with a keyframe
+        if self.recorder is not None:
+            self.recorder.capture(self)
+        return self.observe(out=out)
+
+    observation_size = ObservationBuilder().size
+    action_size = 4
+
+    def observe(
+        self, agent: ent.Entity | None = None, out: np.ndarray | None = None
+    ) -> np.ndarray:
+        """
+        Writes the observation of `agent` (the player by default) into `out`,
+        or into the preallocated `self.observation`, and returns it.
+        """
+        self.observation_builder.gather(self)
+        return self.observation_builder.observe(
+            self.player if agent is None else agent,
+            self.observation if out is None else out,
+        )
+
+    def sense(
+        self, agents: list, angles, max_distance: float, layers: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Casts rays at `angles` from every agent in `agents`, each ignoring
+        itself, and returns `(distances, layers)` with a row per agent. See
+        `RayCaster.cast`.
+        """
+        caster = self.ray_caster
+        caster.gather(self)
+        return caster.cast(
+            [agent.x for agent in agents],
+            [agent.y for agent in agents],
+            angles,
+            max_distance,
+            layers,
+            [agent.entity_id for agent in agents],
+        )
+
+    def apply_action(self, action, agent: Player | None = None) -> None:
+        """
+        `action` is `(move, jump, shoot, aim)`: move left/right when `move` is
+        below -0.5 or above 0.5, jump and shoot when their value is above 0.5,
+        and `aim` is the shooting direction in radians. `agent` defaults to
+        the player; bots driven this way should have their `brain` unset.
+        """
+        if agent is None:
+            agent = self.player
+        agent.apply_action(action)
+        shoot, aim = action[2], action[3]
+        if shoot > 0.5:
+            if agent is self.player:
+                self.player_shoot(aim)
+            else:
+                self.shoot(agent, aim)
+
+    def step(
+        self, action, out: np.ndarray | None = None
+    ) -> tuple[np.ndarray, float, bool, dict]:
+        """
+        Applies `action` to the player, runs one tick and returns
+        `(observation, reward, done, info)`. The observation is written into
+        `out` or `self.observation`, so it is overwritten by the next step.
+        """
+        health = self.player.health
+        kills = self.kills
+        self.apply_action(action)
+        self.next_step()
+        reward = (
+            self.settings.reward_kill * (self.kills - kills)
+            + self.settings.reward_damage_taken * (health - self.player.health)
+        )
+        observation = self.observe(out=out)
+        return observation, reward, self.game_over, {"tick": self.clock.tick}
+
+    def add_entity(self, entity: ent.Entity) -> int:
+        """
+        Adds `entity` to the game and returns its id.
+        """
+        return self.registry.add(entity)
 
-    
-    def run(self):
-        while not self.game_over:
+    def run(self, max_ticks: int | None = None) -> int:
+        """
+        Steps the game as fast as possible until it is over or `max_ticks`
+        ticks have run. Returns the number of ticks run.
+        """
+        ticks = 0
+        while not self.game_over and (max_ticks is None or ticks < max_ticks):
             self.next_step()
+            ticks += 1
+        return ticks
 
     def bot_shoot(self):
-        if random.randint(0, 4) == 1 and self.bots:
+        if self.rng.integers(0, 4, endpoint=True) == 1 and self.bots:
             direction = math.atan2(
                 self.player.y - self.bots[0].y,
                 self.player.x - self.bots[0].x,
             )
-            self.entities.append(self.bots[0].shoot(direction))
+            self.shoot(self.bots[0], direction)
 
     def player_shoot(self, direction: float):
-        self.entities.append(self.player.shoot(direction, "shotgun"))
+        self.shoot(self.player, direction, "shotgun")
 
+    def shoot(self, author: ent.Entity, direction: float, mode: str = "single"):
+        """
+        Fires a pooled bullet from `author`. Nothing is fired while every
+        pooled bullet is in flight.
+        """
+        bullet = self.bullet_pool.acquire(author, direction, mode)
+        if bullet is not None:
+            self.add_entity(bullet)
 
-    def next_step(self):
-        for bot in self.player_like_bots:
-            if random.randint(0, 10) == 1:
-                self.entities.append(bot.random_shoot())
-                
-        for bot in self.bots:
-            if random.randint(0, 10) == 1:
-                self.entities.append(bot.random_shoot())
 
+    # The phases of `next_step`, in the order it runs them
+    phases = ("run_brains", "update_entities", "check_collisions", "remove_queued_entities")
+
+    def next_step(self):
+        if self.profiler.enabled:
+            self._profiled_next_step()
+            return
+        self.run_brains()
         self.update_entities()
         self.check_collisions()
         self.remove_queued_entities()
-        
-
-    def check_collisions(self):
-        for entity1 in self.entities:
-            for entity2 in self.entities:
-                if (entity1 != entity2 and
-                    entity1.check_collision(entity2)):
-                    entity1.evaluate_collision(entity2)
-                
-    def update_entities(self):
+        self.clock.advance()
+        if self.recorder is not None:
+            self.recorder.capture(self)
+
+    def _profiled_next_step(self):
+        profiler = self.profiler
+        profiler.start("next_step")
+        for phase in self.phases:
+            profiler.start(phase)
+            getattr(self, phase)()
+            profiler.stop()
+        self.clock.advance()
+        if self.recorder is not None:
+            self.recorder.capture(self)
+        profiler.stop()
+
+    def record(self, path: str | os.PathLike, keyframe_interval: int = 300):
+        """
+        Starts recording every tick into a replay file at `path` and returns
+        the recorder. Stop with `stop_recording`.
+        """
+        from game.replay import ReplayRecorder
+
+        self.stop_recording()
+        self.recorder = ReplayRecorder(path, self, keyframe_interval)
+        return self.recorder
+
+    def stop_recording(self) -> None:
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def snapshot(self) -> SimulationSnapshot:
+        """
+        Saves the state of the game between ticks, for `restore`.
+        """
+        return SimulationSnapshot(self)
+
+    def restore(self, snapshot: SimulationSnapshot) -> None:
+        """
+        Puts the game back into the state saved in `snapshot`, which may come
+        from another simulation with the same map and settings. Entities
+        present in both keep their objects, and only dynamic entities are
+        touched, so the cost does not depend on the map size.
+        """
+        registry = self.registry
+        alive = {entity.entity_id: entity for entity in registry.dynamic()}
+        if self.player is not None:
+            alive.setdefault(self.player.entity_id, self.player)
+        registry.clear_dynamic()
+        spares: dict[type, list] = {Bullet: self.bullet_pool.drain()}
+
+        restored: dict[int, ent.Entity] = {}
+        blocks = snapshot.blocks + snapshot.detached
+        block_entities = []
+        for block in blocks:
+            entities = []
+            for entity_id in block.ids.tolist():
+                entity = alive.pop(entity_id, None)
+                if entity is None or type(entity) is not block.cls:
+                    if entity is not None:
+                        spares.setdefault(type(entity), []).append(entity)
+                    spare = spares.get(block.cls)
+                    entity = spare.pop() if spare else block.new_entity()
+                restored[entity_id] = entity
+                entities.append(entity)
+            block.write(entities, self)
+            block_entities.append(entities)
+        for entity in alive.values():
+            spares.setdefault(type(entity), []).append(entity)
+
+        for entity_id in snapshot.order.tolist():
+            registry.add(restored[entity_id], entity_id)
+        registry.next_id = snapshot.next_id
+        for block, entities in zip(blocks, block_entities):
+            block.resolve(entities, restored.get)
+        # Buckets come back in their saved order rather than list order
+        for block, entities in zip(snapshot.blocks, block_entities):
+            bucket = registry.bucket(block.cls)
+            bucket[:] = entities
+            for index, entity in enumerate(entities):
+                entity._bucket_index = index
+
+        self.player = restored[snapshot.player_id]
+        self.bots = [restored[entity_id] for entity_id in snapshot.bot_ids]
+        self.bullet_pool.restore(snapshot.bullets_in_flight, spares.get(Bullet, []))
+        self.rng.bit_generator.state = snapshot.rng_state
+        self.clock.tick = snapshot.tick
+        self.game_over = snapshot.game_over
+        self.kills = snapshot.kills
+
+    def fork(self) -> "Simulation":
+        """
+        An independent copy of the game in its current state. The copy
+        shares the map, its obstacles, the settings and the brains with this
+        simulation, so its cost grows with the dynamic entities only. It is
+        neither profiled nor recorded.
+        """
+        fork = copy.copy(self)
+        fork.rng = np.random.Generator(type(self.rng.bit_generator)())
+        fork.clock = SimulationClock(self.clock.fps)
+        fork.profiler = Profiler()
+        fork.recorder = None
+        fork.observation_builder = ObservationBuilder(
+            self.observation_builder.config, self.settings
+        )
+        fork.observation = np.zeros(fork.observation_builder.size)
+        fork.ray_caster = RayCaster()
+        fork._brain_observations = {}
+        fork._retired_bullets = []
+        fork.bullets = []
+        fork.bullet_pool = BulletPool(self.bullet_pool.capacity)
+        fork.store = (
+            EntityStore(self.store.capacity, self.settings, self.statics)
+            if self.store is not None
+            else None
+        )
+        fork.registry = EntityRegistry(fork.store, self.statics)
+        fork.entities = fork.registry.entities
+        fork.player_like_bots = fork.registry.bucket(PlayerLikeBot)
+        fork.planning_bots = fork.registry.bucket(PlanningBot)
+        fork.player = None
+        fork.bots = []
+        fork.restore(self.snapshot())
+        return fork
+
+    def layer_counts(self) -> dict[str, int]:
+        """
+        Number of entities occupying each collision layer.
+        """
+        layers = [layer for layer in ent.CollisionLayers if layer.value]
+        if self.store is not None:
+            occupied = np.concatenate(
+                (self.statics.occupied_mask, self.store.occupied_mask[: self.store.count])
+            )
+            return {
+                layer.name: int(np.count_nonzero(occupied & layer.value))
+                for layer in layers
+            }
+        counts = dict.fromkeys((layer.name for layer in layers), 0)
         for entity in self.entities:
+            for layer in layers:
+                if entity.occupied_mask & layer.value:
+                    counts[layer.name] += 1
+        return counts
+
+    def run_brains(self):
+        """
+        Observes every bot that has a brain, calls each brain once on the
+        batch of its bots and applies the returned actions.
+        """
+        groups: dict[Brain, list] = {}
+        for bot in self.bots + self.player_like_bots + self.planning_bots:
+            if bot.brain is not None:
+                groups.setdefault(bot.brain, []).append(bot)
+        if not groups:
+            return
+
+        builder = self.observation_builder
+        builder.gather(self)
+        for brain, agents in groups.items():
+            brain.gather(self)
+            buffer = self._brain_observations.get(brain)
+            if buffer is None or len(buffer) < len(agents):
+                rows = len(agents) if buffer is None else max(len(agents), 2 * len(buffer))
+                buffer = self._brain_observations[brain] = np.zeros((rows, builder.size))
+            observations = builder.observe_batch(
+                agents, buffer[: len(agents)], brain.observation_blocks
+            )
+            actions = brain.act(observations, agents, self.rng)
+            self._apply_actions(agents, actions)
+
+    def _apply_actions(self, agents: list, actions: np.ndarray) -> None:
+        # Each run of agents of one type moves in one batch, then the agents
+        # that shoot do so in order
+        start = 0
+        while start < len(agents):
+            cls = type(agents[start])
+            stop = start + 1
+            while stop < len(agents) and type(agents[stop]) is cls:
+                stop += 1
+            cls.apply_actions(agents[start:stop], actions[start:stop])
+            start = stop
+        for index in np.flatnonzero(actions[:, 2] > 0.5).tolist():
+            self.shoot(agents[index], actions[index, 3])
+
+    def check_collisions(self) -> int:
+        """
+        Resolves this tick's collisions and returns how many colliding pairs
+        were evaluated.
+        """
+        if self.store is not None:
+            pairs = self.store.resolve_collisions()
+        else:
+            pairs = self._check_listed_collisions()
+        if self.profiler.enabled:
+            self.profiler.set_value("collision_pairs", pairs)
+        return pairs
+
+    def _check_listed_collisions(self) -> int:
+        entities = self.entities
+        first_dynamic = self.registry.static_count
+        pairs = 0
+        grids: dict[int, SpatialHash] = {}
+        for index, entity in enumerate(self.registry.dynamic(), first_dynamic):
+            for layer in entity.occupied_layers:
+                grid = grids.get(layer)
+                if grid is None:
+                    grid = grids[layer] = SpatialHash(self.settings)
+                grid.insert(index, entity)
+
+        ground = ent.CollisionLayers.GROUND.value
+        for index1, entity1 in enumerate(self.registry.dynamic(), first_dynamic):
+            if not entity1.reacts_to_mask:
+                continue
+            last_checked = -1
+            moved = True
+            # Collision responses can move entity1 (e.g. standing on ground),
+            # so its candidates are re-queried from the new position and the
+            # scan resumes after the last pair already checked.
+            while moved:
+                moved = False
+                x, y = entity1.x, entity1.y
+                candidates: set[int] = set()
+                # Only layers entity1 reacts to are queried, so pairs that
+                # `evaluate_collision` would ignore never reach the geometry test.
+                for layer in entity1.reacts_to_layers:
+                    grid = grids.get(layer)
+                    if grid is not None:
+                        grid.query(entity1, candidates)
+                    if layer == ground:
+                        # Obstacle ordinals are their positions in `entities`
+                        self.map.static_grid.query(entity1, candidates)
+                for index2 in sorted(candidates):
+                    if index2 <= last_checked or index2 == index1:
+                        continue
+                    last_checked = index2
+                    entity2 = entities[index2]
+                    if entity1.check_collision(entity2):
+                        pairs += 1
+                        entity1.evaluate_collision(entity2)
+                        if entity1.x != x or entity1.y != y:
+                            for layer in entity1.occupied_layers:
+                                grids[layer].move(index1, entity1)
+                            moved = True
+                            break
+        return pairs
+
+    def update_entities(self):
+        profiler = self.profiler if self.profiler.enabled else None
+        if self.store is not None:
+            self.store.update(profiler)
+            return
+        if profiler is not None:
+            self._profiled_update_entities(profiler)
+            return
+
+        for entity in self.registry.dynamic():
             entity.update()
-            
+
+    def _profiled_update_entities(self, profiler: Profiler):
+        # Timed per entity so the update order stays the list order
+        timings: dict[str, float] = {}
+        for entity in self.registry.dynamic():
+            start = time.perf_counter()
+            entity.update()
+            name = type(entity).__name__
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+        path = profiler.path
+        for name, seconds in timings.items():
+            profiler.record(f"{path};{name}" if path else name, seconds)
+
     def remove_queued_entities(self):
-        temp_ent = []
-        for entity in self.entities:
-            entity.delete_if_too_far()
-            if (not entity.queued_for_deletion):
-                temp_ent.append(entity)
-            elif isinstance(entity,Bot):
-                entity.spawn()
-                temp_ent.append(entity)
-                entity.queued_for_deletion = False
-            elif isinstance(entity,PlayerLikeBot):
-                self.player_like_bots.remove(entity)
-            elif entity is self.player:
-                self.game_over = True
-        self.entities.clear()
-        self.entities = temp_ent
-        
-        
-        
\ No newline at end of file
+        """
+        Lets every entity queued for deletion die and removes those that
+        leave the game. Only the queued entities are visited after culling.
+        """
+        self._retired_bullets.clear()
+        removed = [
+            entity for entity in self.registry.queued() if self._on_death(entity)
+        ]
+        if removed:
+            self.registry.remove(removed)
+        # Bullets go back to the pool only once they are out of the game
+        for bullet in self._retired_bullets:
+            self.bullet_pool.release(bullet)
+
+    def count_kill(self, bot: ent.Entity):
+        if bot.health <= 0:
+            self.kills += 1
+
+    def _respawn_bot(self, bot: Bot) -> bool:
+        self.count_kill(bot)
+        bot.spawn()
+        bot.queued_for_deletion = False
+        return False
+
+    def _remove_bot(self, bot: PlayerLikeBot) -> bool:
+        self.count_kill(bot)
+        return True
+
+    def _retire_bullet(self, bullet: Bullet) -> bool:
+        self._retired_bullets.append(bullet)
+        return True
+
+    def _end_game(self, player: Player) -> bool:
+        self.game_over = True
+        return True
+
+    def _discard(self, entity: ent.Entity) -> bool:
+        return True
+
+    # What happens to a queued entity, looked up along its type's MRO. A
+    # handler returns whether the entity leaves the game.
+    _death_handlers = {
+        Bot: _respawn_bot,
+        PlayerLikeBot: _remove_bot,
+        Bullet: _retire_bullet,
+        Player: _end_game,
+    }
+
+    def _on_death(self, entity: ent.Entity) -> bool:
+        cls = type(entity)
+        handler = self._resolved_death_handlers.get(cls)
+        if handler is None:
+            handler = next(
+                (self._death_handlers[base] for base in cls.__mro__ if base in self._death_handlers),
+                Simulation._discard,
+            )
+            self._resolved_death_handlers[cls] = handler
+        return handler(self, entity)
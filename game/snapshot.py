@@ -0,0 +1,157 @@
+from operator import attrgetter
+
+import numpy as np
+
+# Attributes the registry and store keep on an entity for their own use
+_BOOKKEEPING = {"_store", "_slot", "_index", "_bucket", "_bucket_index", "entity_id"}
+
+
+def _getter(fields) -> attrgetter | None:
+    # attrgetter returns a bare value for one field, a tuple for several
+    if not fields:
+        return None
+    getter = attrgetter(*fields)
+    return getter if len(fields) > 1 else (lambda entity: (getter(entity),))
+
+
+_getters: dict[type, tuple] = {}
+
+
+def _type_getters(cls: type) -> tuple:
+    getters = _getters.get(cls)
+    if getters is None:
+        getters = _getters[cls] = (
+            _getter(tuple(cls.state_fields)),
+            _getter(cls.object_fields),
+            _getter(cls.reference_fields),
+        )
+    return getters
+
+
+class EntityBlock:
+    """
+    The saved state of entities of one type: one row per entity in `values`
+    with a column per `state_fields` entry, the `object_fields` values, the
+    ids of the entities named by `reference_fields` (-1 for none), and the
+    attributes all of them share in `template`.
+    """
+
+    def __init__(self, cls: type, entities: list):
+        self.cls = cls
+        state, objects, references = _type_getters(cls)
+        self.ids = np.array([entity.entity_id for entity in entities], dtype=np.int64)
+        self.values = np.array(
+            [state(entity) for entity in entities], dtype=float
+        ).reshape(len(entities), len(cls.state_fields))
+        self.objects = [objects(entity) for entity in entities] if objects else None
+        self.references = (
+            np.array(
+                [
+                    [-1 if ref is None else ref.entity_id for ref in references(entity)]
+                    for entity in entities
+                ],
+                dtype=np.int64,
+            )
+            if references
+            else None
+        )
+        for array in (self.ids, self.values, self.references):
+            if array is not None:
+                array.setflags(write=False)
+
+        skipped = (
+            _BOOKKEEPING.union(cls.state_fields)
+            .union(cls.object_fields)
+            .union(cls.reference_fields)
+            .union(cls.simulation_fields)
+        )
+        self.template = {
+            name: value
+            for name, value in entities[0].__dict__.items()
+            if name not in skipped
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def new_entity(self):
+        """
+        An entity of this type with the shared attributes only.
+        """
+        entity = self.cls.__new__(self.cls)
+        entity.__dict__.update(self.template)
+        return entity
+
+    def write(self, entities: list, simulation) -> None:
+        """
+        Writes the saved state into `entities`, one per row, which must not
+        be in a store, and binds them to `simulation`. References are set by
+        `resolve` once every entity exists.
+        """
+        cls = self.cls
+        names = list(cls.state_fields.items())
+        shared = [(name, getattr(simulation, name)) for name in cls.simulation_fields]
+        objects = self.objects
+        for row, (entity, values) in enumerate(zip(entities, self.values.tolist())):
+            attributes = entity.__dict__
+            for (name, cast), value in zip(names, values):
+                attributes[name] = cast(value)
+            for name, value in shared:
+                attributes[name] = value
+            if objects is not None:
+                # Set as attributes so property setters recompute their
+                # masks, which reused entities mostly have right already
+                for name, value in zip(cls.object_fields, objects[row]):
+                    if getattr(entity, name, None) is not value:
+                        setattr(entity, name, value)
+
+    def resolve(self, entities: list, lookup) -> None:
+        if self.references is None:
+            return
+        fields = self.cls.reference_fields
+        for entity, ids in zip(entities, self.references.tolist()):
+            for name, entity_id in zip(fields, ids):
+                setattr(entity, name, lookup(entity_id) if entity_id >= 0 else None)
+
+
+class SimulationSnapshot:
+    """
+    The state of a game between ticks, taken with `Simulation.snapshot`.
+
+    Only dynamic entities are saved, one `EntityBlock` per type in bucket
+    order, with `order` holding their ids in list order. The map, settings
+    and brains are shared with the simulation rather than copied. A
+    snapshot can be restored any number of times.
+    """
+
+    def __init__(self, simulation):
+        registry = simulation.registry
+        self.tick = simulation.clock.tick
+        self.game_over = simulation.game_over
+        self.kills = simulation.kills
+        self.rng_state = simulation.rng.bit_generator.state
+        self.next_id = registry.next_id
+        self.bullets_in_flight = simulation.bullet_pool.in_flight
+
+        self.order = np.array(
+            [entity.entity_id for entity in registry.dynamic()], dtype=np.int64
+        )
+        self.order.setflags(write=False)
+        self.blocks = [
+            EntityBlock(cls, bucket)
+            for cls, bucket in registry.buckets.items()
+            if bucket and not cls.is_static
+        ]
+        # Entities that are out of the game but still referenced, such as
+        # the player once the game is over
+        player = simulation.player
+        self.detached = (
+            [EntityBlock(type(player), [player])]
+            if registry.get(player.entity_id) is not player
+            else []
+        )
+        self.player_id = player.entity_id
+        self.bot_ids = [bot.entity_id for bot in simulation.bots]
+
+    def __len__(self) -> int:
+        return len(self.order)
@@ -0,0 +1,107 @@
+import math
+
+import numpy as np
+
+from config import DEFAULT_SETTINGS, GameSettings
+
+
+class SpatialHash:
+    """
+    Uniform grid over the map used as a collision broad phase.
+
+    Entities are stored under integer ids chosen by the caller; the collision
+    pass uses their index in the simulation entity list. Cells outside the
+    map fold back into the grid. That only adds candidates, which the exact
+    `check_collision` test then discards.
+    """
+
+    def __init__(self, settings: GameSettings = DEFAULT_SETTINGS):
+        self.cell_size = cell_size = settings.collision_cell_size
+        self.columns = math.ceil(settings.map_width / cell_size) + 1
+        self._buckets: dict[int, list[int]] = {}
+        self._cells: dict[int, list[int]] = {}
+
+    def _keys_for(self, entity) -> list[int]:
+        half_width = entity.size[0] / 2
+        half_height = entity.size[1] / 2
+        cell_size = self.cell_size
+        left = math.floor((entity.x - half_width) / cell_size)
+        right = math.floor((entity.x + half_width) / cell_size)
+        top = math.floor((entity.y - half_height) / cell_size)
+        bottom = math.floor((entity.y + half_height) / cell_size)
+        return [
+            row * self.columns + column
+            for row in range(top, bottom + 1)
+            for column in range(left, right + 1)
+        ]
+
+    def insert(self, index: int, entity) -> None:
+        keys = self._keys_for(entity)
+        self._cells[index] = keys
+        buckets = self._buckets
+        for key in keys:
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [index]
+            else:
+                bucket.append(index)
+
+    def remove(self, index: int) -> None:
+        for key in self._cells.pop(index):
+            self._buckets[key].remove(index)
+
+    def move(self, index: int, entity) -> None:
+        self.remove(index)
+        self.insert(index, entity)
+
+    def query(self, entity, found: set[int] | None = None) -> set[int]:
+        """
+        Returns ids of entities sharing at least one cell with `entity`,
+        added to `found` if given.
+        """
+        if found is None:
+            found = set()
+        buckets = self._buckets
+        for key in self._keys_for(entity):
+            bucket = buckets.get(key)
+            if bucket:
+                found.update(bucket)
+        return found
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """
+        Packs the grid into flat arrays: bucket `i` holds
+        `ids[offsets[i]:offsets[i + 1]]` under cell key `keys[i]`.
+        """
+        keys = np.array(sorted(self._buckets), dtype=np.int64)
+        sizes = [len(self._buckets[key]) for key in keys.tolist()]
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        ids = np.array(
+            [index for key in keys.tolist() for index in self._buckets[key]],
+            dtype=np.int64,
+        )
+        return {"keys": keys, "offsets": offsets, "ids": ids}
+
+    @classmethod
+    def from_arrays(
+        cls, keys, offsets, ids, settings: GameSettings = DEFAULT_SETTINGS
+    ) -> "SpatialHash":
+        """
+        Rebuilds a grid packed by `to_arrays`. `settings` must have the cell
+        size and map width it was built with.
+        """
+        grid = cls(settings)
+        offsets = offsets.tolist()
+        ids = ids.tolist()
+        cells = grid._cells
+        for position, key in enumerate(keys.tolist()):
+            bucket = ids[offsets[position] : offsets[position + 1]]
+            grid._buckets[key] = bucket
+            for index in bucket:
+                keys_of = cells.get(index)
+                if keys_of is None:
+                    cells[index] = [key]
+                else:
+                    keys_of.append(key)
+        return grid
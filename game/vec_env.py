@@ -0,0 +1,180 @@
+import multiprocessing as mp
+from typing import Callable
+
+import numpy as np
+
+from game.experience import ExperienceBuffer, record_transitions
+from game.simulation import Simulation
+
+
+def _step_env(
+    env: Simulation,
+    action,
+    max_episode_ticks: int | None,
+    out: np.ndarray | None = None,
+) -> tuple[np.ndarray, float, bool, dict]:
+    """
+    Steps one environment and resets it when its episode ends. The last
+    observation of the finished episode is kept in `info`.
+    """
+    observation, reward, done, info = env.step(action, out)
+    if max_episode_ticks is not None and env.clock.tick >= max_episode_ticks:
+        done = True
+    if done:
+        info["terminal_observation"] = observation.copy()
+        observation = env.reset(out)
+    return observation, reward, done, info
+
+
+class VecEnv:
+    """
+    Steps several independent simulations in lockstep in this process.
+
+    Observations, rewards and dones are returned as stacked arrays that are
+    reused between calls, so copy them if they have to outlive the next step.
+    With a `buffer`, every step's transitions are added to it.
+    """
+
+    def __init__(
+        self,
+        env_fns: list[Callable[[], Simulation]],
+        max_episode_ticks: int | None = None,
+        buffer: ExperienceBuffer | None = None,
+    ):
+        self.envs = [env_fn() for env_fn in env_fns]
+        self.num_envs = len(self.envs)
+        self.max_episode_ticks = max_episode_ticks
+        self.observations = np.zeros((self.num_envs, Simulation.observation_size))
+        self.rewards = np.zeros(self.num_envs)
+        self.dones = np.zeros(self.num_envs, dtype=bool)
+        self.buffer = buffer
+        self._previous = np.zeros_like(self.observations)
+        self._next_observations = np.zeros_like(self.observations)
+
+    def reset(self, seed: int | None = None) -> np.ndarray:
+        """
+        Resets every environment, seeding environment `i` with `seed + i`.
+        """
+        for index, env in enumerate(self.envs):
+            env.reset(self.observations[index], None if seed is None else seed + index)
+        return self.observations
+
+    def step(self, actions) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[dict]]:
+        if self.buffer is not None:
+            np.copyto(self._previous, self.observations)
+        infos = []
+        for index, env in enumerate(self.envs):
+            _, reward, done, info = _step_env(
+                env, actions[index], self.max_episode_ticks, self.observations[index]
+            )
+            self.rewards[index] = reward
+            self.dones[index] = done
+            infos.append(info)
+        if self.buffer is not None:
+            record_transitions(
+                self.buffer,
+                self._previous,
+                actions,
+                self.rewards,
+                self.observations,
+                self.dones,
+                infos,
+                self._next_observations,
+            )
+        return self.observations, self.rewards, self.dones, infos
+
+    def close(self) -> None:
+        pass
+
+
+def _worker(remote, env_fn: Callable[[], Simulation], max_episode_ticks: int | None):
+    env = env_fn()
+    while True:
+        command, data = remote.recv()
+        if command == "step":
+            remote.send(_step_env(env, data, max_episode_ticks))
+        elif command == "reset":
+            remote.send(env.reset(seed=data))
+        elif command == "close":
+            remote.close()
+            break
+
+
+class SubprocVecEnv:
+    """
+    Same API as `VecEnv`, but every simulation runs in its own process.
+
+    `env_fns` are sent to the workers, so they have to be picklable, e.g.
+    `Simulation` itself or a `functools.partial` of it.
+    """
+
+    def __init__(
+        self,
+        env_fns: list[Callable[[], Simulation]],
+        max_episode_ticks: int | None = None,
+        start_method: str | None = None,
+        buffer: ExperienceBuffer | None = None,
+    ):
+        context = mp.get_context(start_method)
+        self.num_envs = len(env_fns)
+        self.remotes = []
+        self.processes = []
+        for env_fn in env_fns:
+            remote, worker_remote = context.Pipe()
+            process = context.Process(
+                target=_worker,
+                args=(worker_remote, env_fn, max_episode_ticks),
+                daemon=True,
+            )
+            process.start()
+            worker_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+        self.closed = False
+        self.observations = np.zeros((self.num_envs, Simulation.observation_size))
+        self.rewards = np.zeros(self.num_envs)
+        self.dones = np.zeros(self.num_envs, dtype=bool)
+        self.buffer = buffer
+        self._previous = np.zeros_like(self.observations)
+        self._next_observations = np.zeros_like(self.observations)
+
+    def reset(self, seed: int | None = None) -> np.ndarray:
+        for index, remote in enumerate(self.remotes):
+            remote.send(("reset", None if seed is None else seed + index))
+        for index, remote in enumerate(self.remotes):
+            self.observations[index] = remote.recv()
+        return self.observations
+
+    def step(self, actions) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[dict]]:
+        for remote, action in zip(self.remotes, actions):
+            remote.send(("step", action))
+        if self.buffer is not None:
+            np.copyto(self._previous, self.observations)
+        infos = []
+        for index, remote in enumerate(self.remotes):
+            observation, reward, done, info = remote.recv()
+            self.observations[index] = observation
+            self.rewards[index] = reward
+            self.dones[index] = done
+            infos.append(info)
+        if self.buffer is not None:
+            record_transitions(
+                self.buffer,
+                self._previous,
+                actions,
+                self.rewards,
+                self.observations,
+                self.dones,
+                infos,
+                self._next_observations,
+            )
+        return self.observations, self.rewards, self.dones, infos
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
@@ -0,0 +1,111 @@
+import argparse
+
+import numpy as np
+
+from config import MapConfig, MapGeneratorConfig, PlayerConfig
+from map.loader import obstacles_from_boxes, write_map_json
+from map.map import Map
+
+
+def _slot_grid(config: MapConfig, generator: MapGeneratorConfig) -> tuple[int, int]:
+    # Rows and columns of platform slots, see `generate_boxes`
+    height = generator.platform_height
+    row_spacing = 3 * PlayerConfig().height + height
+    floor_top = config.height - height
+    slot_width = generator.max_platform_width + generator.min_gap
+    rows = max(int((floor_top - height) // row_spacing), 0)
+    columns = max(config.width // slot_width, 0)
+    return rows, columns
+
+
+def platform_slots(
+    config: MapConfig, generator: MapGeneratorConfig = MapGeneratorConfig()
+) -> int:
+    """
+    The most platforms `generate_boxes` can place on a map of this size.
+    """
+    rows, columns = _slot_grid(config, generator)
+    return rows * columns
+
+
+def generate_boxes(
+    config: MapConfig,
+    platforms: int,
+    seed: int | None = None,
+    generator: MapGeneratorConfig = MapGeneratorConfig(),
+) -> np.ndarray:
+    """
+    Returns seeded random level geometry as `left, top, width, height` rows:
+    a floor across the map plus `platforms` platforms. Platforms sit on rows
+    spaced like the built-in level, so each row can be jumped to from the one
+    below, and never overlap within a row. Raises `ValueError` when more
+    platforms are asked for than `platform_slots` fit on the map.
+    """
+    rng = np.random.default_rng(seed)
+    height = generator.platform_height
+    row_spacing = 3 * PlayerConfig().height + height
+    floor_top = config.height - height
+
+    # Every row is cut into slots wide enough for the widest platform plus
+    # the gap; each chosen slot gets one platform placed randomly inside it.
+    slot_width = generator.max_platform_width + generator.min_gap
+    rows, columns = _slot_grid(config, generator)
+    slots = rows * columns
+    if platforms > slots:
+        raise ValueError(
+            f"{platforms} platforms do not fit on a {config.width}x{config.height} map, "
+            f"which has room for {slots}"
+        )
+    chosen = np.sort(rng.choice(slots, size=platforms, replace=False))
+    row, column = np.divmod(chosen, columns) if columns else (chosen, chosen)
+
+    widths = rng.integers(
+        generator.min_platform_width, generator.max_platform_width, size=len(chosen), endpoint=True
+    )
+    lefts = column * slot_width + rng.integers(
+        0, slot_width - generator.min_gap - widths, endpoint=True
+    )
+    tops = floor_top - (row + 1) * row_spacing
+
+    boxes = np.empty((len(chosen) + 1, 4))
+    boxes[0] = (0, floor_top, config.width, height)
+    boxes[1:, 0] = lefts
+    boxes[1:, 1] = tops
+    boxes[1:, 2] = widths
+    boxes[1:, 3] = height
+    return boxes
+
+
+def generate_map(
+    config: MapConfig,
+    platforms: int,
+    seed: int | None = None,
+    generator: MapGeneratorConfig = MapGeneratorConfig(),
+) -> Map:
+    boxes = generate_boxes(config, platforms, seed, generator)
+    return Map(obstacles_from_boxes(boxes), config)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Writes a random map file.")
+    parser.add_argument("path", help="JSON file to write")
+    parser.add_argument("--width", type=int, default=MapConfig().width)
+    parser.add_argument("--height", type=int, default=MapConfig().height)
+    parser.add_argument(
+        "--platforms", type=int, default=None, help="default: as many as fit"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MapConfig(width=args.width, height=args.height)
+    platforms = args.platforms if args.platforms is not None else platform_slots(config)
+    try:
+        boxes = generate_boxes(config, platforms, args.seed)
+    except ValueError as error:
+        parser.error(str(error))
+    write_map_json(args.path, config, boxes)
+    print(f"{args.path}: {len(boxes) - 1} platforms on {args.width}x{args.height}")
+
+
+if __name__ == "__main__":
+    main()
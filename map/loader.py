@@ -0,0 +1,131 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from config import GameSettings, MapConfig
+from game.spatial_hash import SpatialHash
+from map.map import Map
+from map.obstacle import Obstacle
+from map.platform_index import PlatformIndex
+
+# Bumped whenever the cache layout changes, so stale caches are rebuilt
+CACHE_VERSION = 1
+# Directory next to a map file that holds its binary cache
+CACHE_DIR = ".map_cache"
+
+
+def cache_path(path: str | os.PathLike) -> Path:
+    path = Path(path)
+    return path.parent / CACHE_DIR / path.with_suffix(".npz").name
+
+
+def read_map_json(path: str | os.PathLike) -> tuple[MapConfig, np.ndarray]:
+    """
+    Reads a JSON map file: `width`, `height` and a list of `obstacles`, each
+    with the top-left corner `x`, `y` and its `width` and `height`. Returns
+    the map config and the obstacle boxes as `left, top, width, height` rows.
+    """
+    with open(path) as file:
+        data = json.load(file)
+    config = MapConfig(width=int(data["width"]), height=int(data["height"]))
+    boxes = np.array(
+        [(o["x"], o["y"], o["width"], o["height"]) for o in data["obstacles"]],
+        dtype=float,
+    ).reshape(-1, 4)
+    return config, boxes
+
+
+def write_map_json(path: str | os.PathLike, config: MapConfig, boxes: np.ndarray) -> None:
+    data = {
+        "width": config.width,
+        "height": config.height,
+        "obstacles": [
+            {"x": left, "y": top, "width": width, "height": height}
+            for left, top, width, height in np.asarray(boxes).tolist()
+        ],
+    }
+    with open(path, "w") as file:
+        json.dump(data, file, indent=4)
+
+
+def save_cache(path: str | os.PathLike, game_map: Map) -> None:
+    """
+    Writes the map boxes, platform index and static grid as NumPy arrays.
+    """
+    grid = {f"grid_{name}": array for name, array in game_map.static_grid.to_arrays().items()}
+    index = {f"index_{name}": array for name, array in game_map.index.arrays().items()}
+    np.savez(
+        path,
+        version=CACHE_VERSION,
+        size=np.array([game_map.width, game_map.height]),
+        cell_size=game_map.config.collision_cell_size,
+        boxes=game_map.boxes,
+        **index,
+        **grid,
+    )
+
+
+def load_cache(path: str | os.PathLike) -> Map | None:
+    """
+    Loads a map written by `save_cache`, or returns `None` if the file has an
+    older layout.
+    """
+    with np.load(path) as data:
+        if int(data["version"]) != CACHE_VERSION:
+            return None
+        width, height = data["size"].tolist()
+        config = MapConfig(
+            width=width, height=height, collision_cell_size=int(data["cell_size"])
+        )
+        boxes = data["boxes"]
+        index = PlatformIndex(
+            data["index_order"],
+            data["index_left"],
+            data["index_right"],
+            data["index_top"],
+            data["index_bottom"],
+        )
+        static_grid = SpatialHash.from_arrays(
+            data["grid_keys"],
+            data["grid_offsets"],
+            data["grid_ids"],
+            GameSettings(config),
+        )
+    return Map(obstacles_from_boxes(boxes), config, index, static_grid)
+
+
+def obstacles_from_boxes(boxes: np.ndarray) -> list[Obstacle]:
+    return [Obstacle.from_box(*box) for box in np.asarray(boxes).tolist()]
+
+
+def load_map(path: str | os.PathLike, use_cache: bool = True) -> Map:
+    """
+    Loads a `.json` or `.npz` map. A JSON map is compiled into a binary cache
+    in a `.map_cache` directory next to it on first load, and later loads
+    read the cache as long as it is newer than the JSON file.
+    """
+    path = Path(path)
+    if path.suffix == ".npz":
+        game_map = load_cache(path)
+        if game_map is None:
+            raise ValueError(f"{path} was written by an older map cache version")
+        return game_map
+
+    cache = cache_path(path)
+    if use_cache and cache.exists() and cache.stat().st_mtime >= path.stat().st_mtime:
+        game_map = load_cache(cache)
+        if game_map is not None:
+            return game_map
+
+    config, boxes = read_map_json(path)
+    game_map = Map(obstacles_from_boxes(boxes), config)
+    if use_cache:
+        try:
+            cache.parent.mkdir(exist_ok=True)
+            save_cache(cache, game_map)
+        except OSError:
+            # A read-only map directory only costs the faster reload
+            pass
+    return game_map
@@ -1,32 +1,87 @@
-from config import MapConfig
+from collections.abc import Sequence
+
+import numpy as np
+
+from config import GameSettings, MapConfig
+from game.spatial_hash import SpatialHash
 from map.obstacle import (
     Obstacle,
     ObstacleFloor,
     ObstaclePlatformLong,
     ObstaclePlatformShort,
 )
+from map.platform_index import PlatformIndex
+
+
+def default_obstacles() -> list[Obstacle]:
+    """
+    The built-in level, laid out for the default `MapConfig` size.
+    """
+    obstacles: list[Obstacle] = []
+
+    obstacles.append(ObstacleFloor())
+    obstacles.append(ObstaclePlatformShort(x=50, floor=1))
+    obstacles.append(ObstaclePlatformLong(x=300, floor=1))
+    obstacles.append(ObstaclePlatformShort(x=900, floor=1))
+    obstacles.append(ObstaclePlatformLong(x=1300, floor=1))
+
+    obstacles.append(ObstaclePlatformLong(x=0, floor=2))
+    obstacles.append(ObstaclePlatformLong(x=500, floor=2))
+    obstacles.append(ObstaclePlatformLong(x=1000, floor=2))
+    obstacles.append(ObstaclePlatformLong(x=1500, floor=2))
+
+    obstacles.append(ObstaclePlatformShort(x=100, floor=3))
+    obstacles.append(ObstaclePlatformLong(x=300, floor=3))
+    obstacles.append(ObstaclePlatformShort(x=700, floor=3))
+    obstacles.append(ObstaclePlatformShort(x=900, floor=3))
+    obstacles.append(ObstaclePlatformLong(x=1200, floor=3))
+    return obstacles
 
 
 class Map:
-    def __init__(self):
-        self.width = MapConfig().width
-        self.height = MapConfig().height
-
-        self.obstacles: list[Obstacle] = []
-
-        self.obstacles.append(ObstacleFloor())
-        self.obstacles.append(ObstaclePlatformShort(x=50, floor=1))
-        self.obstacles.append(ObstaclePlatformLong(x=300, floor=1))
-        self.obstacles.append(ObstaclePlatformShort(x=900, floor=1))
-        self.obstacles.append(ObstaclePlatformLong(x=1300, floor=1))
-
-        self.obstacles.append(ObstaclePlatformLong(x=0, floor=2))
-        self.obstacles.append(ObstaclePlatformLong(x=500, floor=2))
-        self.obstacles.append(ObstaclePlatformLong(x=1000, floor=2))
-        self.obstacles.append(ObstaclePlatformLong(x=1500, floor=2))
-
-        self.obstacles.append(ObstaclePlatformShort(x=100, floor=3))
-        self.obstacles.append(ObstaclePlatformLong(x=300, floor=3))
-        self.obstacles.append(ObstaclePlatformShort(x=700, floor=3))
-        self.obstacles.append(ObstaclePlatformShort(x=900, floor=3))
-        self.obstacles.append(ObstaclePlatformLong(x=1200, floor=3))
+    """
+    Static level geometry, built once and shared by everything in a simulation.
+
+    Obstacles never change after construction, so the map also carries their
+    boxes as an `(n, 4)` array of `left, top, width, height`, the `index` of
+    platform boxes and the `static_grid` used by the collision pass. Without
+    `obstacles` the built-in level is used. `index` and `static_grid` can be
+    passed in when they were loaded from a cache.
+    """
+
+    def __init__(
+        self,
+        obstacles: Sequence[Obstacle] | None = None,
+        config: MapConfig = MapConfig(),
+        index: PlatformIndex | None = None,
+        static_grid: SpatialHash | None = None,
+    ):
+        self.config = config
+        self.width = config.width
+        self.height = config.height
+
+        if obstacles is None:
+            obstacles = default_obstacles()
+        self.obstacles: tuple[Obstacle, ...] = tuple(obstacles)
+        self.boxes = np.array(
+            [
+                (o.x - o.size[0] / 2, o.y - o.size[1] / 2, o.size[0], o.size[1])
+                for o in self.obstacles
+            ],
+            dtype=float,
+        ).reshape(-1, 4)
+        self.boxes.flags.writeable = False
+
+        self.index = index if index is not None else PlatformIndex.from_boxes(self.boxes)
+        if static_grid is None:
+            # Keyed by position in `obstacles`
+            static_grid = SpatialHash(self.settings())
+            for ordinal, obstacle in enumerate(self.obstacles):
+                static_grid.insert(ordinal, obstacle)
+        self.static_grid = static_grid
+
+    def settings(self) -> GameSettings:
+        """
+        Default game settings for playing on this map.
+        """
+        return GameSettings(self.config)
@@ -4,6 +4,8 @@ import characters.entity as ent
 
 
 class Obstacle(ent.Entity):
+    is_static = True
+
     def __init__(self,x = 0,floor = 0):
         super().__init__()
         self.x = x + self.width/2
@@ -17,6 +19,24 @@ class Obstacle(ent.Entity):
         )
         self.collision_layer = ent.CollisionLayers.GROUND
 
+    def delete_if_too_far(self):
+        # Obstacles are the map, they can't leave it
+        pass
+
+    @classmethod
+    def from_box(cls, left: float, top: float, width: float, height: float):
+        """
+        Obstacle covering the box with top-left corner `(left, top)`, the way
+        map files describe them.
+        """
+        obstacle = cls()
+        obstacle.width = width
+        obstacle.height = height
+        obstacle.size = [width, height]
+        obstacle.x = left + width / 2
+        obstacle.y = top + height / 2
+        return obstacle
+
 
 class ObstaclePlatformShort(Obstacle):
     def __init__(self, x=0, floor = 0):
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class PlatformIndex:
+    """
+    Static obstacle boxes as NumPy arrays sorted by their top edge.
+
+    Built once per map. Indices returned by the queries refer to the map's
+    `obstacles`.
+    """
+
+    def __init__(self, order, left, right, top, bottom):
+        self.order = np.asarray(order, dtype=np.int64)
+        self.left = np.asarray(left, dtype=float)
+        self.right = np.asarray(right, dtype=float)
+        self.top = np.asarray(top, dtype=float)
+        self.bottom = np.asarray(bottom, dtype=float)
+        for array in self.arrays().values():
+            array.flags.writeable = False
+
+    @classmethod
+    def from_boxes(cls, boxes: np.ndarray) -> "PlatformIndex":
+        """
+        Builds the index from an `(n, 4)` array of `left, top, width, height`.
+        """
+        left, top, width, height = np.asarray(boxes, dtype=float).reshape(-1, 4).T
+        order = np.argsort(top, kind="stable")
+        return cls(
+            order,
+            left[order],
+            (left + width)[order],
+            top[order],
+            (top + height)[order],
+        )
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "order": self.order,
+            "left": self.left,
+            "right": self.right,
+            "top": self.top,
+            "bottom": self.bottom,
+        }
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def overlapping(self, left: float, top: float, right: float, bottom: float) -> np.ndarray:
+        """
+        Returns the obstacles touching the box, in order of their top edge.
+        """
+        stop = np.searchsorted(self.top, bottom, side="right")
+        hits = (
+            (self.left[:stop] <= right)
+            & (left <= self.right[:stop])
+            & (top <= self.bottom[:stop])
+        )
+        return self.order[:stop][hits]